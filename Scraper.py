@@ -8,26 +8,55 @@ DamaDam Online Bot - Single File v3.2.1
 - Adaptive delay to avoid Google API rate limits
 """
 
+import time
+_MODULE_STARTED = time.perf_counter()
 import os
 import sys
 import re
-import time
 import json
+import argparse
+import importlib
 import random
+import hashlib
+import statistics
+import bisect
+import threading
+import dbm
+import sqlite3
+import mmap
+import struct
+import gzip
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+import multiprocessing
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 
+try:
+    import fcntl
+except ImportError:  # Windows: spool appends stay line-atomic, just unlocked
+    fcntl = None
+
 # ------------ Selenium ------------
+# Only the cheap parts load with the module. WebDriverWait/expected_conditions (which
+# pull in the remote driver) and gspread/google-auth are imported inside the functions
+# that use them, so commands that never open Chrome or Sheets start fast.
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.common.exceptions import TimeoutException, WebDriverException, NoSuchElementException
 
-# ------------ Google Sheets ------------
-import gspread
-from google.oauth2.service_account import Credentials
-from gspread.exceptions import WorksheetNotFound, APIError
+IMPORT_TIMES = {}
+
+def timed_import(label: str, *modules: str):
+    """Import heavy modules up front, once, and record how long it took (for startup_summary)."""
+    if label in IMPORT_TIMES:
+        return
+    started = time.perf_counter()
+    for name in modules:
+        importlib.import_module(name)
+    IMPORT_TIMES[label] = time.perf_counter() - started
+    log_msg(f"📦 {label} imported in {IMPORT_TIMES[label]:.2f}s")
 
 # ------------ Configuration (Env) ------------
 LOGIN_URL = "https://damadam.pk/login/"
@@ -49,6 +78,78 @@ MAX_DELAY = float(os.getenv('MAX_DELAY', '0.7'))
 PAGE_LOAD_TIMEOUT = int(os.getenv('PAGE_LOAD_TIMEOUT', '30'))
 SHEET_WRITE_DELAY = float(os.getenv('SHEET_WRITE_DELAY', '1.0'))
 
+# Sharding: WORKERS>1 splits one run across local processes; SHARD_COUNT/SHARD_INDEX
+# with SHARD_ROLE=worker|writer splits it across separate runner jobs sharing SPOOL_DIR.
+WORKERS = int(os.getenv('WORKERS', '1'))
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))
+SHARD_INDEX = int(os.getenv('SHARD_INDEX', '0'))
+SHARD_ROLE = os.getenv('SHARD_ROLE', '').strip().lower()
+SPOOL_DIR = os.getenv('SPOOL_DIR', 'spool')
+SPOOL_RUN_ID = os.getenv('SPOOL_RUN_ID', os.getenv('GITHUB_RUN_ID', ''))
+SPOOL_TIMEOUT = int(os.getenv('SPOOL_TIMEOUT', '3000'))
+# An active shard that spools nothing for this long is treated as dead (runner-job mode)
+SHARD_STALL_TIMEOUT = int(os.getenv('SHARD_STALL_TIMEOUT', '600'))
+
+# Traffic capture: record = archive every fetched page, replay = serve pages from the archive (no Chrome)
+TRAFFIC_MODE = os.getenv('TRAFFIC_MODE', '').strip().lower()
+TRAFFIC_ARCHIVE = os.getenv('TRAFFIC_ARCHIVE', 'traffic')
+
+# Chrome supervision: recycle after N pages, above an RSS limit (MB) or after an error streak
+DRIVER_RECYCLE_PAGES = int(os.getenv('DRIVER_RECYCLE_PAGES', '250'))
+DRIVER_MAX_RSS_MB = int(os.getenv('DRIVER_MAX_RSS_MB', '1500'))
+DRIVER_ERROR_STREAK = int(os.getenv('DRIVER_ERROR_STREAK', '3'))
+
+# AIMD pacing of damadam.pk requests (MIN_DELAY is the spacing floor)
+SITE_MAX_SPACING = float(os.getenv('SITE_MAX_SPACING', '10'))
+SITE_AIMD_STEP = float(os.getenv('SITE_AIMD_STEP', '0.05'))
+SITE_AIMD_WINDOW = int(os.getenv('SITE_AIMD_WINDOW', '5'))
+SITE_LATENCY_SPIKE = float(os.getenv('SITE_LATENCY_SPIKE', '3.0'))
+
+# Run performance history (local JSONL + Dashboard) and regression flagging
+RUN_HISTORY_FILE = os.getenv('RUN_HISTORY_FILE', 'run_history.jsonl')
+REGRESSION_WINDOW = int(os.getenv('REGRESSION_WINDOW', '10'))
+REGRESSION_THRESHOLD = float(os.getenv('REGRESSION_THRESHOLD', '0.3'))
+REGRESSION_ZERO_LIMIT = float(os.getenv('REGRESSION_ZERO_LIMIT', '5'))  # absolute limit when the baseline median is 0
+SHEET_RETRIES = int(os.getenv('SHEET_RETRIES', '3'))
+
+# Output: sheets (default) | local (JSONL files only) | local+sync (local + async Sheets sync)
+OUTPUT_BACKEND = os.getenv('OUTPUT_BACKEND', 'sheets').strip().lower()
+OUTPUT_DIR = os.getenv('OUTPUT_DIR', 'output')
+LOCAL_BATCH_SIZE = int(os.getenv('LOCAL_BATCH_SIZE', '50'))
+SYNC_INTERVAL = float(os.getenv('SYNC_INTERVAL', '30'))
+
+# Append-only field-delta log (sqlite); empty disables. Cell notes are opt-in now.
+CHANGE_LOG_DB = os.getenv('CHANGE_LOG_DB', 'changelog.db')
+ENABLE_CELL_NOTES = os.getenv('ENABLE_CELL_NOTES', '0') == '1'
+# Hot/cold tiering: rows not scraped for ARCHIVE_AFTER_DAYS (and the oldest rows beyond
+# HOT_MAX_ROWS) move from ProfilesOnline to monthly "Archive YYYY-MM" worksheets,
+# kept in ARCHIVE_SHEET_URL when set (a separate spreadsheet has its own cell limit).
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+HOT_MAX_ROWS = int(os.getenv('HOT_MAX_ROWS', '0'))
+ARCHIVE_SHEET_URL = os.getenv('ARCHIVE_SHEET_URL', '')
+ARCHIVE_PREFIX = "Archive "
+# Reapply fonts/banding/sort on every run (0 = only via the format-sheets command)
+SHEET_FORMAT_ON_RUN = os.getenv('SHEET_FORMAT_ON_RUN', '1') == '1'
+
+# Presence poller (`python Scraper.py poll-online`): only /online_kon/, NickList synced in bulk
+POLL_INTERVAL = float(os.getenv('POLL_INTERVAL', '60'))
+POLL_SYNC_EVERY = float(os.getenv('POLL_SYNC_EVERY', '300'))
+POLL_DURATION = float(os.getenv('POLL_DURATION', '0'))
+PRESENCE_FILE = os.getenv('PRESENCE_FILE', 'presence.jsonl')
+RUN_RECORDS_SIGHTINGS = os.getenv('RUN_RECORDS_SIGHTINGS', '1') == '1'
+
+# Presence timeline: one bit per nick per slot in a memory-mapped ring (empty path disables)
+PRESENCE_INDEX = os.getenv('PRESENCE_INDEX', 'presence.idx')
+PRESENCE_SLOT_MINUTES = int(os.getenv('PRESENCE_SLOT_MINUTES', '60'))
+PRESENCE_WINDOW_DAYS = int(os.getenv('PRESENCE_WINDOW_DAYS', '28'))
+
+# Replays never touch production state: no change log, and run history plus local
+# output live under the archive (so `sync` can't push replayed profiles to Sheets)
+if TRAFFIC_MODE == 'replay':
+    CHANGE_LOG_DB = ''
+    RUN_HISTORY_FILE = os.path.join(TRAFFIC_ARCHIVE, 'run_history.jsonl')
+    OUTPUT_DIR = os.path.join(TRAFFIC_ARCHIVE, 'out')
+
 COLUMN_ORDER = [
     "IMAGE", "NICK NAME", "TAGS", "LAST POST", "LAST POST TIME", "FRIEND", "CITY",
     "GENDER", "MARRIED", "AGE", "JOINED", "FOLLOWERS", "STATUS",
@@ -57,6 +158,8 @@ COLUMN_ORDER = [
 COLUMN_TO_INDEX = {name: idx for idx, name in enumerate(COLUMN_ORDER)}
 HIGHLIGHT_EXCLUDE_COLUMNS = {"LAST POST", "LAST POST TIME", "JOINED", "PROFILE LINK", "DATETIME SCRAP"}
 LINK_COLUMNS = {"IMAGE", "LAST POST", "PROFILE LINK"}
+# Link cells are rewritten by _update_links after the row is written, so they never match a fresh scrape
+TRACKED_INDICES = [i for i, c in enumerate(COLUMN_ORDER) if c not in HIGHLIGHT_EXCLUDE_COLUMNS and c not in LINK_COLUMNS]
 ENABLE_CELL_HIGHLIGHT = False
 SUSPENSION_INDICATORS = [
     "accounts suspend",
@@ -65,6 +168,22 @@ SUSPENSION_INDICATORS = [
     "kisi aur user ki identity apnana",
     "accounts suspend kiye",
 ]
+DASHBOARD_HEADERS = [
+    "Run#", "Timestamp", "Profiles", "Success", "Failed", "New", "Updated", "Unchanged",
+    "Trigger", "Start", "End", "Profiles/Min", "Sheets Calls/Profile", "Quota Retries",
+    "Site Sec", "Sheets Sec", "P95 Sec", "Regression", "Site Req/Min",
+]
+# Dashboard column -> (history key, True if a higher value is better); used for regression checks
+PERF_COLUMNS = {
+    "Profiles/Min": ("profiles_per_min", True),
+    "Sheets Calls/Profile": ("sheets_calls_per_profile", False),
+    "Quota Retries": ("quota_retries", False),
+    "Site Sec": ("site_sec", False),
+    "Sheets Sec": ("sheets_sec", False),
+    "P95 Sec": ("p95_sec", False),
+    "Site Req/Min": ("site_rate", True),
+}
+REGRESSION_KEYS = ("profiles_per_min", "sheets_calls_per_profile", "quota_retries", "p95_sec")
 NICK_LIST_SHEET = "NickList"
 NICK_LIST_HEADERS = [
     "Nick Name",
@@ -183,7 +302,7 @@ def scrape_recent_post(driver, nickname:str)->dict:
     try:
         driver.get(post_url)
         try:
-            WebDriverWait(driver,5).until(EC.presence_of_element_located((By.CSS_SELECTOR,"article.mbl")))
+            wait_for_css(driver, "article.mbl", 5)
         except TimeoutException:
             return {'LPOST':'','LDATE-TIME':''}
 
@@ -220,6 +339,56 @@ def scrape_recent_post(driver, nickname:str)->dict:
     except Exception:
         return {'LPOST':'','LDATE-TIME':''}
 
+# ------------ Existing-Profile Index ------------
+
+def row_fingerprint(values) -> int:
+    """64-bit digest of the change-tracked cells (HIGHLIGHT_EXCLUDE_COLUMNS and LINK_COLUMNS are ignored)."""
+    h = hashlib.blake2b(digest_size=8)
+    for i in TRACKED_INDICES:
+        h.update((values[i] if i < len(values) else "").encode('utf-8'))
+        h.update(b"\x1f")
+    return int.from_bytes(h.digest(), 'big')
+
+class ProfileRecord:
+    """Compact index entry for one ProfilesOnline row.
+
+    Only the row number, DATETIME SCRAP and a fingerprint of the tracked cells are
+    kept; the full row is fetched when it changed. Startup only reads columns B and
+    R, so fingerprint stays None until Sheets.prefetch_rows() has seen the row.
+    """
+    __slots__ = ("row", "scraped", "fingerprint")
+
+    def __init__(self, row: int, scraped: str = "", fingerprint: int | None = None):
+        self.row = row
+        self.scraped = scraped
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def from_values(cls, row: int, values) -> "ProfileRecord":
+        idx = COLUMN_TO_INDEX["DATETIME SCRAP"]
+        return cls(row, values[idx] if idx < len(values) else "", row_fingerprint(values))
+
+SCRAP_TIME_FORMATS = ("%d-%b-%y %I:%M %p", "%m/%d/%Y %H:%M:%S", "%d/%m/%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+def parse_scrap_time(text: str) -> datetime | None:
+    """DATETIME SCRAP cell ("19-Oct-26 05:22 AM", or as Sheets re-rendered it) as a datetime, None if unreadable."""
+    for fmt in SCRAP_TIME_FORMATS:
+        try:
+            return datetime.strptime((text or "").strip(), fmt)
+        except ValueError:
+            continue
+    return None
+
+def row_runs(rows) -> list[list[int]]:
+    """Sorted row numbers as contiguous [first, last] runs."""
+    runs = []
+    for r in sorted(rows):
+        if runs and r == runs[-1][1] + 1:
+            runs[-1][1] = r
+        else:
+            runs.append([r, r])
+    return runs
+
 # ------------ Adaptive Delay ------------
 class AdaptiveDelay:
     def __init__(self, mn, mx):
@@ -240,14 +409,449 @@ class AdaptiveDelay:
     def on_batch(self):
         self.min_delay = min(3.0, max(self.base_min, self.min_delay*1.1))
         self.max_delay = min(6.0, max(self.base_max, self.max_delay*1.1))
+    def delay(self) -> float:
+        return random.uniform(self.min_delay, self.max_delay)
     def sleep(self):
-        time.sleep(random.uniform(self.min_delay, self.max_delay))
+        time.sleep(self.delay())
 
 adaptive = AdaptiveDelay(MIN_DELAY, MAX_DELAY)
 
+# ------------ Site Pacing (AIMD) ------------
+class AimdController:
+    """Additive-increase / multiplicative-decrease pacing of damadam.pk requests.
+
+    Each scrape reports its latency and outcome. A healthy request takes SITE_AIMD_STEP
+    off the spacing. Every SITE_AIMD_WINDOW healthy requests in a row add one to the
+    concurrency. A timeout, a browser error, or latency above SITE_LATENCY_SPIKE times
+    the running average doubles the spacing and halves the concurrency.
+    """
+    def __init__(self, min_spacing: float, max_spacing: float = SITE_MAX_SPACING, max_concurrency: int = 1):
+        self.min_spacing = min_spacing; self.max_spacing = max_spacing
+        self.max_concurrency = max(1, max_concurrency)
+        self.begin()
+    def begin(self):
+        self.spacing = self.min_spacing
+        self.concurrency = 1
+        self.latency_avg = None
+        self.streak = 0
+        self.requests = 0; self.errors = 0; self.timeouts = 0; self.backoffs = 0
+        self.started = time.time()
+    def observe(self, latency: float, outcome: str = "ok"):
+        """Feed one request: outcome is "ok", "timeout" or "error"."""
+        self.requests += 1
+        if outcome == "timeout": self.timeouts += 1
+        elif outcome != "ok": self.errors += 1
+        spike = outcome == "ok" and self.latency_avg is not None and latency > SITE_LATENCY_SPIKE * self.latency_avg
+        if outcome == "ok":
+            self.latency_avg = latency if self.latency_avg is None else 0.8*self.latency_avg + 0.2*latency
+        if outcome != "ok" or spike:
+            self.backoffs += 1; self.streak = 0
+            self.spacing = min(self.max_spacing, max(self.spacing, self.min_spacing, 0.1) * 2)
+            self.concurrency = max(1, self.concurrency // 2)
+            return
+        self.streak += 1
+        self.spacing = max(self.min_spacing, self.spacing - SITE_AIMD_STEP)
+        if self.streak >= SITE_AIMD_WINDOW:
+            self.streak = 0
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+    def rate(self) -> float:
+        """Current target request rate (requests/min) the controller has settled on."""
+        per_request = self.spacing + (self.latency_avg or 0.0)
+        return round(60.0 * self.concurrency / per_request, 1) if per_request > 0 else 0.0
+    def error_rate(self) -> float:
+        return (self.errors + self.timeouts) / self.requests if self.requests else 0.0
+    def sleep(self, floor: float = 0.0):
+        time.sleep(max(self.spacing, floor))
+
+site_controller = AimdController(MIN_DELAY, max_concurrency=max(WORKERS, SHARD_COUNT))
+
+# ------------ Run Metrics ------------
+class RunMetrics:
+    """Timings and counters for one run (Dashboard perf columns + run history)."""
+    def __init__(self):
+        self.begin()
+    def begin(self):
+        self.started = time.time()
+        self.sheets_calls = 0; self.quota_retries = 0
+        self.site_time = 0.0; self.sheets_time = 0.0
+        self.latencies = []
+    def add_profile(self, site_secs: float, sheets_secs: float):
+        self.site_time += site_secs; self.sheets_time += sheets_secs
+        self.latencies.append(site_secs + sheets_secs)
+    def p95(self) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered)-1, int(round(0.95*(len(ordered)-1))))]
+    def summary(self) -> dict:
+        profiles = len(self.latencies)
+        minutes = (time.time()-self.started)/60
+        return {
+            "profiles_per_min": round(profiles/minutes, 2) if minutes > 0 else 0.0,
+            "sheets_calls_per_profile": round(self.sheets_calls/profiles, 2) if profiles else 0.0,
+            "quota_retries": self.quota_retries,
+            "site_sec": round(self.site_time, 1),
+            "sheets_sec": round(self.sheets_time, 1),
+            "p95_sec": round(self.p95(), 2),
+        }
+
+run_metrics = RunMetrics()
+
+def load_run_history(path: str = RUN_HISTORY_FILE) -> list[dict]:
+    runs = []
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    try: runs.append(json.loads(line))
+                    except ValueError: continue
+    except OSError:
+        pass
+    return runs
+
+def append_run_history(entry: dict, path: str = RUN_HISTORY_FILE):
+    try:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError as e:
+        log_msg(f"Run history write failed: {e}")
+
+def detect_regressions(current: dict, history: list[dict]) -> list[str]:
+    """Compare a run against the median of the last REGRESSION_WINDOW runs."""
+    baseline = [h for h in history if h.get("profiles")][-REGRESSION_WINDOW:]
+    if len(baseline) < 3:
+        return []
+    flags = []
+    for key in REGRESSION_KEYS:
+        higher_is_better = next(hb for k, hb in PERF_COLUMNS.values() if k == key)
+        values = [float(h[key]) for h in baseline if isinstance(h.get(key), (int, float))]
+        if len(values) < 3:
+            continue
+        base = statistics.median(values)
+        if base <= 0:
+            value = float(current.get(key, 0))
+            if not higher_is_better and value >= REGRESSION_ZERO_LIMIT:
+                flags.append(f"{key} 0 -> {value:g}")
+            continue
+        change = (float(current.get(key, 0)) - base) / base
+        if (higher_is_better and change < -REGRESSION_THRESHOLD) or (not higher_is_better and change > REGRESSION_THRESHOLD):
+            flags.append(f"{key} {change:+.0%}")
+    return flags
+
+# ------------ Record / Replay ------------
+
+class TrafficArchive:
+    """Content-addressed, gzip-compressed archive of fetched damadam pages.
+
+    Page bodies live in objects/<sha[:2]>/<sha>.gz (identical pages are stored once);
+    manifest.jsonl lists every fetch as {"url", "sha", "t"} in order. Replay serves the
+    most recent body recorded for a URL.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.objects = os.path.join(directory, "objects")
+        self.manifest = os.path.join(directory, "manifest.jsonl")
+        os.makedirs(self.objects, exist_ok=True)
+        self._index = None
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return (url or "").strip().rstrip('/')
+
+    def put(self, url: str, html: str):
+        data = (html or "").encode('utf-8')
+        sha = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.objects, sha[:2], sha + ".gz")
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with gzip.open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        with open(self.manifest, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"url": self._key(url), "sha": sha, "t": get_pkt_time().strftime("%Y-%m-%d %H:%M:%S")}) + "\n")
+        if self._index is not None:
+            self._index[self._key(url)] = sha
+
+    def _load(self) -> dict:
+        if self._index is None:
+            self._index = {}
+            try:
+                with open(self.manifest, encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            rec = json.loads(line)
+                            self._index[rec["url"]] = rec["sha"]
+            except OSError:
+                pass
+        return self._index
+
+    def get(self, url: str) -> str | None:
+        sha = self._load().get(self._key(url))
+        if not sha:
+            return None
+        with gzip.open(os.path.join(self.objects, sha[:2], sha + ".gz"), 'rb') as f:
+            return f.read().decode('utf-8')
+
+class RecordingDriver:
+    """Wraps a real Chrome driver and archives the page behind every get()."""
+    replay = False
+
+    def __init__(self, driver, archive: TrafficArchive):
+        self._driver = driver
+        self._archive = archive
+
+    def get(self, url: str):
+        self._driver.get(url)
+        try:
+            self._archive.put(url, self._driver.page_source)
+        except Exception as e:
+            log_msg(f"Traffic capture failed for {url}: {str(e)[:60]}")
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+VOID_TAGS = {"area","base","br","col","embed","hr","img","input","link","meta","param","source","track","wbr"}
+BLOCK_TAGS = {"p","div","li","ul","ol","br","h1","h2","h3","h4","h5","h6","article","section","tr","td","table","form","header","footer"}
+
+class _Node:
+    __slots__ = ("tag", "attrs", "children", "parent")
+    def __init__(self, tag: str, attrs: dict, parent):
+        self.tag = tag; self.attrs = attrs; self.children = []; self.parent = parent
+    def elements(self):
+        return [c for c in self.children if isinstance(c, _Node)]
+    def descendants(self):
+        stack = list(reversed(self.elements()))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.elements()))
+    def own_text(self) -> str:
+        return "".join(c for c in self.children if isinstance(c, str))
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = _Node("#root", {}, None)
+        self.cur = self.root
+    def handle_starttag(self, tag, attrs):
+        node = _Node(tag, {k: (v or "") for k, v in attrs}, self.cur)
+        self.cur.children.append(node)
+        if tag not in VOID_TAGS:
+            self.cur = node
+    def handle_startendtag(self, tag, attrs):
+        self.cur.children.append(_Node(tag, {k: (v or "") for k, v in attrs}, self.cur))
+    def handle_endtag(self, tag):
+        node = self.cur
+        while node is not self.root and node.tag != tag:
+            node = node.parent
+        if node is not self.root:
+            self.cur = node.parent
+    def handle_data(self, data):
+        self.cur.children.append(data)
+
+_CSS_PART = re.compile(r"""(\*|[a-zA-Z][\w-]*)|\.([\w-]+)|\#([\w-]+)|:(first-child|last-child)|"""
+                       r"""\[\s*([\w-]+)\s*(?:([*^$~|]?=)\s*(?:'([^']*)'|"([^"]*)"|([^\]\s]+)))?\s*\]""")
+_XPATH_SIBLING = re.compile(r"""^//([\w*]+)\[contains\(text\(\),\s*['"]([^'"]*)['"]\)\]/following-sibling::([\w*]+)\[1\]$""")
+
+def _split_outside(text: str, seps: str) -> list[str]:
+    """Split on any char in `seps` that is not inside [...] or quotes."""
+    parts, buf, depth, quote = [], "", 0, ""
+    for ch in text:
+        if quote:
+            quote = "" if ch == quote else quote
+        elif ch in "'\"":
+            quote = ch
+        elif ch == "[":
+            depth += 1
+        elif ch == "]":
+            depth -= 1
+        elif ch in seps and depth == 0:
+            parts.append(buf); buf = ""
+            continue
+        buf += ch
+    parts.append(buf)
+    return parts
+
+def _parse_compound(text: str) -> list:
+    parts, pos = [], 0
+    while pos < len(text):
+        m = _CSS_PART.match(text, pos)
+        if not m or m.end() == pos or (m.group(1) and pos):
+            raise ValueError(f"Unsupported selector: {text}")
+        parts.append(m.groups()); pos = m.end()
+    return parts
+
+def _parse_css(selector: str) -> list[list[tuple[str, list]]]:
+    """Selector groups as [(combinator, compound parts), ...]; supports tag, .class, #id, [attr op val], :first-child, ' ' and '>'."""
+    groups = []
+    for group in _split_outside(selector, ","):
+        chain, comb = [], " "
+        for token in _split_outside(group.replace(">", " > "), " \t\n"):
+            if not token:
+                continue
+            if token == ">":
+                comb = ">"; continue
+            chain.append((comb, _parse_compound(token))); comb = " "
+        if chain:
+            groups.append(chain)
+    return groups
+
+def _match_compound(node: _Node, parts) -> bool:
+    for tag, cls, ident, pseudo, attr, op, v1, v2, v3 in parts:
+        if tag and tag != "*" and node.tag != tag.lower():
+            return False
+        if cls and cls not in node.attrs.get("class", "").split():
+            return False
+        if ident and node.attrs.get("id") != ident:
+            return False
+        if pseudo:
+            siblings = node.parent.elements() if node.parent else [node]
+            if siblings[0 if pseudo == "first-child" else -1] is not node:
+                return False
+        if attr:
+            if attr not in node.attrs:
+                return False
+            if op:
+                have, want = node.attrs[attr], next(v for v in (v1, v2, v3) if v is not None)
+                ok = {"=": have == want, "*=": want in have, "^=": have.startswith(want), "$=": have.endswith(want),
+                      "~=": want in have.split(), "|=": have == want or have.startswith(want + "-")}[op]
+                if not ok:
+                    return False
+    return True
+
+def _match_chain(node: _Node, chain, idx: int) -> bool:
+    comb, parts = chain[idx]
+    if not _match_compound(node, parts):
+        return False
+    if idx == 0:
+        return True
+    parent = node.parent
+    if comb == ">":
+        return parent is not None and parent.tag != "#root" and _match_chain(parent, chain, idx-1)
+    while parent is not None and parent.tag != "#root":
+        if _match_chain(parent, chain, idx-1):
+            return True
+        parent = parent.parent
+    return False
+
+class ReplayElement:
+    """The slice of Selenium's WebElement API the scrapers use, over a parsed node."""
+    def __init__(self, node: _Node, driver):
+        self._node = node
+        self._driver = driver
+
+    @property
+    def tag_name(self) -> str:
+        return self._node.tag
+
+    @property
+    def text(self) -> str:
+        parts = []
+        def walk(n):
+            for c in n.children:
+                if isinstance(c, str):
+                    parts.append(c)
+                elif c.tag not in ("script", "style"):
+                    if c.tag in BLOCK_TAGS: parts.append(" ")
+                    walk(c)
+                    if c.tag in BLOCK_TAGS: parts.append(" ")
+        walk(self._node)
+        return re.sub(r"\s+", " ", "".join(parts)).strip()
+
+    def get_attribute(self, name: str):
+        value = self._node.attrs.get(name)
+        if value is not None and name in ("href", "src"):
+            return urljoin(self._driver.current_url, value)
+        return value
+
+    def find_elements(self, by: str, value: str) -> list:
+        return self._driver._find(self._node, by, value)
+
+    def find_element(self, by: str, value: str):
+        found = self.find_elements(by, value)
+        if not found:
+            raise NoSuchElementException(f"{by}={value}")
+        return found[0]
+
+class ReplayDriver(ReplayElement):
+    """Stands in for Chrome: serves archived pages and answers the CSS/XPath lookups the scrapers make."""
+    replay = True
+
+    def __init__(self, archive: TrafficArchive):
+        self.archive = archive
+        self.current_url = HOME_URL
+        self.page_source = ""
+        self.misses = 0
+        super().__init__(_Node("#root", {}, None), self)
+
+    def get(self, url: str):
+        self.current_url = url
+        html = self.archive.get(url)
+        if html is None:
+            self.misses += 1
+            html = ""
+        self.page_source = html
+        builder = _TreeBuilder()
+        builder.feed(html); builder.close()
+        self._node = builder.root
+
+    def _find(self, scope: _Node, by: str, value: str) -> list:
+        if by == By.XPATH:
+            m = _XPATH_SIBLING.match(value.strip())
+            if not m:
+                raise ValueError(f"Unsupported XPath in replay: {value}")
+            tag, needle, sibling_tag = m.groups()
+            out = []
+            for node in self._node.descendants():
+                if (tag == "*" or node.tag == tag) and needle in node.own_text():
+                    siblings = node.parent.elements()
+                    nxt = [s for s in siblings[siblings.index(node)+1:] if sibling_tag == "*" or s.tag == sibling_tag]
+                    if nxt:
+                        out.append(ReplayElement(nxt[0], self))
+            return out
+        if by != By.CSS_SELECTOR:
+            raise ValueError(f"Unsupported locator in replay: {by}")
+        groups = _parse_css(value)
+        return [ReplayElement(n, self) for n in scope.descendants()
+                if any(_match_chain(n, chain, len(chain)-1) for chain in groups)]
+
+    def refresh(self):
+        self.get(self.current_url)
+    def get_cookies(self) -> list:
+        return []
+    def add_cookie(self, cookie):
+        pass
+    def execute_script(self, *args):
+        return None
+    def set_page_load_timeout(self, seconds):
+        pass
+    def quit(self):
+        pass
+
+def wait_for_css(driver, selector: str, timeout: float):
+    """WebDriverWait for a CSS selector; replayed pages are complete, so they are checked once."""
+    if getattr(driver, 'replay', False):
+        try:
+            return driver.find_element(By.CSS_SELECTOR, selector)
+        except NoSuchElementException:
+            raise TimeoutException(f"{selector} not in replayed page")
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    return WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.CSS_SELECTOR, selector)))
+
+def settle(driver, seconds: float):
+    """Give a live page time to settle (skipped in replay)."""
+    if not getattr(driver, 'replay', False):
+        time.sleep(seconds)
+
 # ------------ Browser ------------
 
 def setup_browser():
+    timed_import("selenium", "selenium.webdriver.support.ui", "selenium.webdriver.chrome.webdriver")
+    if TRAFFIC_MODE == 'replay':
+        log_msg(f"Replaying pages from {TRAFFIC_ARCHIVE} (no Chrome)")
+        return ReplayDriver(TrafficArchive(TRAFFIC_ARCHIVE))
     try:
         log_msg("Setting up Chrome...")
         opts = Options()
@@ -263,6 +867,8 @@ def setup_browser():
         driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
         driver.execute_script("Object.defineProperty(navigator,'webdriver',{get:()=>undefined})")
         log_msg("Chrome ready")
+        if TRAFFIC_MODE == 'record':
+            return RecordingDriver(driver, TrafficArchive(TRAFFIC_ARCHIVE))
         return driver
     except Exception as e:
         log_msg(f"Browser error: {e}")
@@ -293,17 +899,27 @@ def load_cookies(driver):
         log_msg(f"Cookie load failed: {e}")
         return False
 
+def restore_session(driver) -> bool:
+    """Log in from the saved cookie file only (no credentials)."""
+    driver.get(HOME_URL); settle(driver, 2)
+    if load_cookies(driver):
+        driver.refresh(); settle(driver, 3)
+        if 'login' not in driver.current_url.lower():
+            log_msg("✅ Login via cookies successful")
+            return True
+        log_msg("⚠️ Cookies expired, attempting fresh login...")
+    return False
+
 def login(driver) -> bool:
+    if getattr(driver, 'replay', False):
+        return True
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
     try:
         # Step 1: Try loading cookies first
         log_msg("🔐 Checking for saved cookies...")
-        driver.get(HOME_URL); time.sleep(2)
-        if load_cookies(driver):
-            driver.refresh(); time.sleep(3)
-            if 'login' not in driver.current_url.lower():
-                log_msg("✅ Login via cookies successful")
-                return True
-            log_msg("⚠️ Cookies expired, attempting fresh login...")
+        if restore_session(driver):
+            return True
         
         # Step 2: Try Account 1, then Account 2
         driver.get(LOGIN_URL); time.sleep(3)
@@ -338,11 +954,248 @@ def login(driver) -> bool:
         log_msg(f"❌ Login error: {e}")
         return False
 
+def process_tree_rss_mb(pid: int) -> float:
+    """Resident memory of a process and all its descendants in MB (Linux /proc; 0 elsewhere)."""
+    if not pid or not os.path.isdir('/proc'):
+        return 0.0
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    total_kb = 0
+    stack = [pid]
+    while stack:
+        p = stack.pop()
+        try:
+            with open(f'/proc/{p}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+                        break
+        except (OSError, ValueError):
+            pass
+        stack.extend(children.get(p, []))
+    return total_kb / 1024
+
+class DriverSupervisor:
+    """Owns the Chrome driver for a run and replaces it before it degrades.
+
+    The driver is recycled after DRIVER_RECYCLE_PAGES pages, when chromedriver and
+    Chrome together use more than DRIVER_MAX_RSS_MB, or when it crashed or failed
+    DRIVER_ERROR_STREAK profiles in a row. A recycled driver restores the session
+    from saved cookies and only falls back to login() when they are stale. The
+    interrupted nickname is retried once.
+    """
+    def __init__(self, driver=None):
+        self.driver = driver
+        self.pages = 0
+        self.rss_checked_at = 0
+        self.error_streak = 0
+        self.recycles = 0
+        self.last_outcome = "ok"
+        self.last_latency = 0.0
+
+    def start(self) -> bool:
+        self.driver = setup_browser()
+        return bool(self.driver) and login(self.driver)
+
+    def alive(self) -> bool:
+        try:
+            self.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def rss_mb(self) -> float:
+        process = getattr(getattr(self.driver, 'service', None), 'process', None)
+        return process_tree_rss_mb(getattr(process, 'pid', 0))
+
+    def recycle(self, reason: str) -> bool:
+        log_msg(f"♻️ Recycling Chrome ({reason})")
+        if self.alive():
+            save_cookies(self.driver)
+        self.quit()
+        self.driver = setup_browser()
+        if not self.driver:
+            return False
+        self.recycles += 1
+        self.pages = 0; self.rss_checked_at = 0; self.error_streak = 0
+        try:
+            return login(self.driver)  # tries the saved cookies first
+        except WebDriverException as e:
+            log_msg(f"❌ Session restore failed: {str(e)[:60]}")
+            return False
+
+    def _recycle_due(self) -> str | None:
+        if getattr(self.driver, 'replay', False):
+            return None
+        if DRIVER_RECYCLE_PAGES and self.pages >= DRIVER_RECYCLE_PAGES:
+            return f"{self.pages} pages"
+        if DRIVER_MAX_RSS_MB and self.pages - self.rss_checked_at >= 10:
+            self.rss_checked_at = self.pages
+            rss = self.rss_mb()
+            if rss > DRIVER_MAX_RSS_MB:
+                return f"{rss:.0f} MB RSS"
+        return None
+
+    def _scrape_once(self, nickname: str) -> dict | None:
+        report = {}
+        prof = scrape_profile(self.driver, nickname, report)
+        self.pages += 1
+        self.last_outcome = report.get("outcome", "error")
+        self.last_latency = report.get("latency", 0.0)
+        self.error_streak = 0 if self.last_outcome == "ok" else self.error_streak + 1
+        return prof
+
+    def scrape(self, nickname: str) -> dict | None:
+        """scrape_profile on a healthy driver, retried once on a fresh one if the browser broke.
+
+        Errors and timeouts both count toward DRIVER_ERROR_STREAK (a hung renderer
+        shows up as timeouts). last_outcome/last_latency describe the final attempt.
+        """
+        reason = self._recycle_due()
+        if reason:
+            self.recycle(reason)
+        prof = self._scrape_once(nickname)
+        if self.last_outcome == "ok":
+            return prof
+        crashed = not self.alive()
+        if crashed or self.error_streak >= DRIVER_ERROR_STREAK:
+            reason = "browser crashed" if crashed else f"{self.error_streak} failures in a row"
+            if self.recycle(reason):
+                prof = self._scrape_once(nickname)
+        return prof
+
+    def quit(self):
+        if self.driver:
+            try: self.driver.quit()
+            except: pass
+            self.driver = None
+
+# ------------ Change Log ------------
+
+class ChangeLog:
+    """Append-only log of field deltas per nickname per scrape (sqlite, opened lazily).
+
+    Rows are (nick, ts, col, value) with col the COLUMN_ORDER index, indexed by
+    nick and by (col, ts) for "history of X" and "whose CITY changed today" lookups.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS deltas (nick TEXT NOT NULL, ts INTEGER NOT NULL, col INTEGER NOT NULL, value TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS deltas_nick ON deltas (nick, ts);"
+                "CREATE INDEX IF NOT EXISTS deltas_col_ts ON deltas (col, ts);"
+            )
+        return self._conn
+
+    def record(self, nickname: str, delta: dict, seen_at: datetime | None = None):
+        if not self.path or not delta:
+            return
+        ts = int((seen_at or get_pkt_time()).timestamp())
+        key = nickname.strip().lower()
+        try:
+            with self.conn:
+                self.conn.executemany("INSERT INTO deltas VALUES (?, ?, ?, ?)",
+                                      [(key, ts, int(col), value) for col, value in delta.items()])
+        except sqlite3.Error as e:
+            log_msg(f"Change log write failed: {e}")
+
+    def history(self, nickname: str) -> list[tuple[datetime, dict]]:
+        """All scrapes that changed something for a nickname, oldest first: [(when, {column: value})]."""
+        out = []
+        rows = self.conn.execute("SELECT ts, col, value FROM deltas WHERE nick = ? ORDER BY ts, col", (nickname.strip().lower(),))
+        for ts, col, value in rows:
+            when = datetime.fromtimestamp(ts)
+            if not out or out[-1][0] != when:
+                out.append((when, {}))
+            out[-1][1][COLUMN_ORDER[col]] = value
+        return out
+
+    def changed(self, column: str, since: datetime | None = None) -> list[tuple[str, datetime, str]]:
+        """Nicknames whose `column` changed since `since` (default: today, PKT): [(nick, when, new value)].
+
+        First sightings are not changes, so a nick's earliest value for the column is skipped.
+        """
+        since = since or get_pkt_time().replace(hour=0, minute=0, second=0, microsecond=0)
+        rows = self.conn.execute(
+            "SELECT nick, ts, value FROM deltas d WHERE col = ? AND ts >= ? AND EXISTS "
+            "(SELECT 1 FROM deltas p WHERE p.nick = d.nick AND p.col = d.col AND p.ts < d.ts) ORDER BY ts",
+            (COLUMN_TO_INDEX[column], int(since.timestamp())))
+        return [(nick, datetime.fromtimestamp(ts), value) for nick, ts, value in rows]
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+change_log = ChangeLog(CHANGE_LOG_DB)
+
+# ------------ Output Backends ------------
+
+def profile_row_values(profile: dict, tags_mapping: dict | None = None) -> list[str]:
+    """Normalize a scraped profile in place and return its cells in COLUMN_ORDER."""
+    if profile.get("LAST POST TIME"):
+        profile["LAST POST TIME"] = convert_relative_date_to_absolute(profile["LAST POST TIME"])
+    # Keep the scrape time a profile already carries (synced/replayed profiles are written later)
+    profile["DATETIME SCRAP"] = profile.get("DATETIME SCRAP") or get_pkt_time().strftime("%d-%b-%y %I:%M %p")
+    tags_value = (tags_mapping or {}).get((profile.get("NICK NAME") or "").strip().lower())
+    if tags_value:
+        profile["TAGS"] = tags_value
+    row_values = []
+    for c in COLUMN_ORDER:
+        if c == "IMAGE":
+            v = ""
+        elif c == "PROFILE LINK":
+            v = "Profile" if profile.get(c) else ""
+        elif c == "LAST POST":
+            v = "Post" if profile.get(c) else ""
+        else:
+            v = clean_data(profile.get(c, ""))
+        row_values.append(v)
+    return row_values
+
+def initial_delta(row_values: list[str]) -> dict:
+    """Change-log delta for a first sighting: every non-empty tracked cell."""
+    return {i: row_values[i] for i in TRACKED_INDICES if row_values[i]}
+
+class OutputBackend:
+    """Where a run's results go. Sheets is the default; LocalSink and SyncedOutput are alternatives."""
+    def write_profile(self, profile: dict) -> dict:
+        raise NotImplementedError
+    def record_nick_seen(self, nickname: str, seen_at: datetime | None = None):
+        raise NotImplementedError
+    def update_dashboard(self, metrics: dict):
+        raise NotImplementedError
+    def prefetch_rows(self, nicknames):
+        pass
+    def archive_cold(self) -> int:
+        return 0
+    def run_history(self) -> list[dict]:
+        return load_run_history()
+    def close(self):
+        pass
+
 # ------------ Google Sheets ------------
 
 def gsheets_client():
     if not SHEET_URL:
         print("❌ GOOGLE_SHEET_URL is not set."); sys.exit(1)
+    timed_import("gspread", "gspread", "google.oauth2.service_account")
+    import gspread
+    from google.oauth2.service_account import Credentials
     scope = ["https://www.googleapis.com/auth/spreadsheets","https://www.googleapis.com/auth/drive"]
     gac_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS','').strip()
     try:
@@ -357,20 +1210,37 @@ def gsheets_client():
     except Exception as e:
         print(f"❌ Google auth failed: {e}"); sys.exit(1)
 
-class Sheets:
-    def __init__(self, client):
+class Sheets(OutputBackend):
+    def __init__(self, client, nick_list_only: bool = False, format_only: bool = False):
         self.client = client
         self.tags_mapping = {}
         self.existing = {}
+        self._row_cache = {}
+        self.fingerprint_misses = 0
         self.nick_list_existing = {}
         self.nick_list_next_row = 2
+        self.dashboard_rows = []
+        self.archived = {}
+        self._archive_ss = None
+        self._archive_ws = {}
         self.ss = client.open_by_url(SHEET_URL)
+        if nick_list_only:
+            # Presence poller: NickList is all it touches
+            self._ensure_nick_list()
+            return
+        if format_only:
+            # format-sheets: just the worksheets, none of the indexes
+            self.ws = self._get_or_create("ProfilesOnline", cols=len(COLUMN_ORDER))
+            self.dashboard = self._get_or_create("Dashboard", cols=len(DASHBOARD_HEADERS))
+            self.nick_list_ws = self._get_or_create(NICK_LIST_SHEET, cols=len(NICK_LIST_HEADERS))
+            self._format()
+            return
         self.ws = self._get_or_create("ProfilesOnline", cols=len(COLUMN_ORDER))
         self.tags_sheet = self._get_sheet_if_exists("Tags")
         # Ensure headers exist for ProfilesOnline
         try:
-            values = self.ws.get_all_values()
-            if not values or not values[0] or all(not c for c in values[0]):
+            header = self.ws.row_values(1)
+            if not header or all(not c for c in header):
                 log_msg("Initializing ProfilesOnline headers...")
                 self.ws.append_row(COLUMN_ORDER)
                 try: self.ws.freeze(rows=1)
@@ -379,33 +1249,86 @@ class Sheets:
             log_msg(f"Header init failed: {e}")
         # Dashboard worksheet
         try:
-            self.dashboard = self._get_or_create("Dashboard", cols=11)
+            self.dashboard = self._get_or_create("Dashboard", cols=len(DASHBOARD_HEADERS))
             dvals = self.dashboard.get_all_values()
-            expected = ["Run#","Timestamp","Profiles","Success","Failed","New","Updated","Unchanged","Trigger","Start","End"]
-            if not dvals or dvals[0] != expected:
+            expected = DASHBOARD_HEADERS
+            if dvals and dvals[0] and expected[:len(dvals[0])] == dvals[0]:
+                # Older header without the perf columns: extend it, keep the history rows
+                if dvals[0] != expected:
+                    if self.dashboard.col_count < len(expected):
+                        self.dashboard.add_cols(len(expected) - self.dashboard.col_count)
+                    self.dashboard.update(range_name=f"A1:{column_letter(len(expected)-1)}1", values=[expected])
+            else:
                 self.dashboard.clear()
                 self.dashboard.append_row(expected)
+            self.dashboard_rows = dvals[1:] if dvals else []
         except Exception as e:
             log_msg(f"Dashboard setup failed: {e}")
-        self._format()
+        if SHEET_FORMAT_ON_RUN:
+            self._format()
         self._load_existing()
+        self._load_archived()
         self._load_tags_mapping()
-        self._ensure_nick_list()
+        self._ensure_nick_list(format_sheet=SHEET_FORMAT_ON_RUN)
 
     def _get_or_create(self, name, cols=20, rows=1000):
+        from gspread.exceptions import WorksheetNotFound
         try:
             return self.ss.worksheet(name)
         except WorksheetNotFound:
             return self.ss.add_worksheet(title=name, rows=rows, cols=cols)
 
     def _get_sheet_if_exists(self, name):
+        from gspread.exceptions import WorksheetNotFound
         try:
             return self.ss.worksheet(name)
         except WorksheetNotFound:
             log_msg(f"{name} sheet not found, skipping optional features")
             return None
 
+    def _api(self, fn, *args, **kwargs):
+        """Run one Sheets call: counted for run metrics, retried with backoff on quota (429) errors."""
+        from gspread.exceptions import APIError
+        for attempt in range(SHEET_RETRIES + 1):
+            run_metrics.sheets_calls += 1
+            try:
+                return fn(*args, **kwargs)
+            except APIError as e:
+                if attempt >= SHEET_RETRIES or not ("429" in str(e) or "quota" in str(e).lower()):
+                    raise
+                run_metrics.quota_retries += 1
+                adaptive.on_rate_limit()
+                wait = min(60, 5 * 2**attempt)
+                log_msg(f"⏳ Sheets quota hit, retrying in {wait}s")
+                time.sleep(wait)
+
+    def run_history(self) -> list[dict]:
+        """Past runs from the Dashboard rows, merged with the local history file by run number."""
+        runs = {}
+        for r in self.dashboard_rows:
+            rec = dict(zip(DASHBOARD_HEADERS, r))
+            try:
+                run = int(rec.get("Run#", ""))
+            except ValueError:
+                continue
+            entry = {"run": run, "profiles": rec.get("Profiles", "")}
+            try:
+                entry["profiles"] = int(entry["profiles"])
+            except ValueError:
+                entry["profiles"] = 0
+            for col, (key, _) in PERF_COLUMNS.items():
+                try:
+                    entry[key] = float(rec.get(col, ""))
+                except ValueError:
+                    pass
+            runs[run] = entry
+        for entry in load_run_history():
+            if isinstance(entry.get("run"), int):
+                runs[entry["run"]] = {**runs.get(entry["run"], {}), **entry}
+        return [runs[k] for k in sorted(runs)]
+
     def _apply_banding(self, sheet, end_col, start_row=1):
+        from gspread.exceptions import APIError
         try:
             end_col = max(end_col, 1)
             req = {
@@ -449,17 +1372,21 @@ class Sheets:
             log_msg(f"ProfilesOnline format failed: {e}")
         try:
             # Dashboard: Courier New, header bold, alternating rows
-            self.dashboard.format("A:K", {"textFormat":{"fontFamily":"Courier New","fontSize":8,"bold":False}})
-            self.dashboard.format("A1:K1", {"textFormat":{"fontFamily":"Courier New","fontSize":9,"bold":True},"horizontalAlignment":"CENTER","backgroundColor":{"red":1.0,"green":0.6,"blue":0.0}})
+            last_col = column_letter(len(DASHBOARD_HEADERS)-1)
+            self.dashboard.format(f"A:{last_col}", {"textFormat":{"fontFamily":"Courier New","fontSize":8,"bold":False}})
+            self.dashboard.format(f"A1:{last_col}1", {"textFormat":{"fontFamily":"Courier New","fontSize":9,"bold":True},"horizontalAlignment":"CENTER","backgroundColor":{"red":1.0,"green":0.6,"blue":0.0}})
             try: self.dashboard.freeze(rows=1)
             except: pass
             self._apply_banding(self.dashboard, self.dashboard.col_count, start_row=1)
             # Sort by Timestamp (Col B) descending
             try:
-                self.dashboard.sort((2, "des"), range="A1:K")
+                self.dashboard.sort((2, "des"), range=f"A1:{last_col}")
             except: pass
         except Exception as e:
             log_msg(f"Dashboard format failed: {e}")
+        self._format_nick_list()
+
+    def _format_nick_list(self):
         try:
             # NickList: Courier New, header bold, alternating rows
             if hasattr(self, 'nick_list_ws') and self.nick_list_ws:
@@ -478,14 +1405,122 @@ class Sheets:
     def _load_existing(self):
         try:
             self.existing = {}
-            rows = self.ws.get_all_values()[1:]
-            for i, r in enumerate(rows, start=2):
-                if len(r)>1 and r[1].strip():
-                    self.existing[r[1].strip().lower()] = {'row': i, 'data': r}
+            self._row_cache = {}
+            self.fingerprint_misses = 0
+            # Only NICK NAME (B) and DATETIME SCRAP (R); full rows come later via prefetch_rows()
+            scrap_col = column_letter(COLUMN_TO_INDEX["DATETIME SCRAP"])
+            nicks, scraped = self.ws.batch_get(["B2:B", f"{scrap_col}2:{scrap_col}"])
+            for i, r in enumerate(nicks, start=2):
+                if r and r[0].strip():
+                    s_row = scraped[i-2] if i-2 < len(scraped) else []
+                    self.existing[r[0].strip().lower()] = ProfileRecord(i, s_row[0] if s_row else "")
             log_msg(f"Loaded {len(self.existing)} existing")
         except Exception as e:
             log_msg(f"Load existing failed: {e}")
 
+    def _archive_book(self):
+        if self._archive_ss is None:
+            self._archive_ss = self.client.open_by_url(ARCHIVE_SHEET_URL) if ARCHIVE_SHEET_URL else self.ss
+        return self._archive_ss
+
+    def _archive_sheet(self, title: str):
+        ws = self._archive_ws.get(title)
+        if ws is None:
+            from gspread.exceptions import WorksheetNotFound
+            book = self._archive_book()
+            try:
+                ws = book.worksheet(title)
+            except WorksheetNotFound:
+                ws = book.add_worksheet(title=title, rows=100, cols=len(COLUMN_ORDER))
+                self._api(ws.append_row, COLUMN_ORDER)
+                try: ws.freeze(rows=1)
+                except: pass
+            self._archive_ws[title] = ws
+        return ws
+
+    def _load_archived(self):
+        """Index archived nicknames as {key: (archive title, row)} from column B of every archive worksheet."""
+        self.archived = {}
+        try:
+            book = self._archive_book()
+            sheets = [ws for ws in self._api(book.worksheets) if ws.title.startswith(ARCHIVE_PREFIX)]
+            if not sheets:
+                return
+            sheets.sort(key=lambda ws: ws.title)
+            self._archive_ws.update({ws.title: ws for ws in sheets})
+            resp = self._api(book.values_batch_get, [f"'{ws.title}'!B2:B" for ws in sheets])
+            # Oldest month first, so a nickname archived more than once maps to its latest row
+            for ws, vr in zip(sheets, resp.get("valueRanges", [])):
+                title = sys.intern(ws.title)
+                for i, r in enumerate(vr.get("values", []), start=2):
+                    if r and r[0].strip():
+                        self.archived[r[0].strip().lower()] = (title, i)
+            log_msg(f"Loaded {len(self.archived)} archived nicknames from {len(sheets)} archive sheet(s)")
+        except Exception as e:
+            log_msg(f"Load archive index failed: {e}")
+
+    def archive_cold(self, max_age_days: int = ARCHIVE_AFTER_DAYS, max_rows: int = HOT_MAX_ROWS) -> int:
+        """Move cold rows from ProfilesOnline into monthly archive worksheets in bulk.
+
+        Cold means DATETIME SCRAP older than `max_age_days`, plus the oldest rows
+        beyond `max_rows`. Month by month, rows are appended to the archive and then
+        exactly those rows are deleted (one batch delete), so a failure part-way
+        leaves the remaining months hot and nothing archived twice. Both indexes
+        are reloaded afterwards. Rows with an unreadable DATETIME SCRAP are left alone.
+        """
+        if not max_age_days and not max_rows:
+            return 0
+        dated = sorted(((ts, key, rec) for key, rec in self.existing.items()
+                        if (ts := parse_scrap_time(rec.scraped))), key=lambda t: t[0])
+        cutoff = get_pkt_time() - timedelta(days=max_age_days) if max_age_days else datetime.min
+        count = sum(1 for ts, _, _ in dated if ts < cutoff)
+        if max_rows:
+            count = max(count, len(self.existing) - max_rows)
+        cold = dated[:count]
+        if not cold:
+            return 0
+        wanted = {rec.row: (ts, key) for ts, key, rec in cold}
+        last_col = column_letter(len(COLUMN_ORDER)-1)
+        runs = row_runs(wanted)
+        months = {}
+        try:
+            for start in range(0, len(runs), 100):
+                part = runs[start:start+100]
+                ranges = self._api(self.ws.batch_get, [f"A{lo}:{last_col}{hi}" for lo, hi in part])
+                for (lo, hi), values in zip(part, ranges):
+                    for row, vals in zip(range(lo, hi+1), values):
+                        ts, key = wanted[row]
+                        # Only move rows whose nickname still matches the index
+                        if len(vals) > 1 and vals[1].strip().lower() == key:
+                            vals = list(vals) + [""] * (len(COLUMN_ORDER) - len(vals))
+                            months.setdefault(f"{ARCHIVE_PREFIX}{ts:%Y-%m}", []).append((ts, row, vals))
+        except Exception as e:
+            log_msg(f"⚠️ Archive rollover failed: {e}")
+            months = {}
+        moved, archived_to = [], []
+        for title in sorted(months):
+            entries = sorted(months[title], key=lambda e: e[0])
+            try:
+                # RAW, like ProfilesOnline itself: user text must not turn into formulas, numbers or dates
+                self._api(self._archive_sheet(title).append_rows, [vals for _, _, vals in entries], value_input_option='RAW')
+                # Delete exactly this month's rows, shifted up by the rows already removed;
+                # bottom-up within the batch so its ranges don't move either
+                rows = [row - bisect.bisect_left(moved, row) for _, row, _ in entries]
+                reqs = [{"deleteDimension": {"range": {"sheetId": self.ws.id, "dimension": "ROWS", "startIndex": lo-1, "endIndex": hi}}}
+                        for lo, hi in reversed(row_runs(rows))]
+                self._api(self.ss.batch_update, {"requests": reqs})
+            except Exception as e:
+                log_msg(f"⚠️ Archive rollover stopped at {title}: {e}")
+                break
+            for _, row, _ in entries:
+                bisect.insort(moved, row)
+            archived_to.append(title)
+        self._load_existing()
+        self._load_archived()
+        if moved:
+            log_msg(f"🧊 Archived {len(moved)} cold rows into {', '.join(archived_to)}; {len(self.existing)} rows stay hot")
+        return len(moved)
+
     def _load_tags_mapping(self):
         self.tags_mapping = {}
         if not self.tags_sheet:
@@ -513,7 +1548,7 @@ class Sheets:
         except Exception as e:
             log_msg(f"Tags load failed: {e}")
 
-    def _ensure_nick_list(self):
+    def _ensure_nick_list(self, format_sheet: bool = False):
         try:
             self.nick_list_ws = self._get_or_create(NICK_LIST_SHEET, cols=len(NICK_LIST_HEADERS))
             values = self.nick_list_ws.get_all_values()
@@ -527,11 +1562,14 @@ class Sheets:
             log_msg(f"Nick list init failed: {e}")
             self.nick_list_ws = None
             return
+        if format_sheet:
+            # Sorting moves rows, so it has to happen before they are indexed
+            self._format_nick_list()
         self._load_nick_list()
 
-    def _load_nick_list(self):
+    def _load_nick_list(self) -> bool:
         if not getattr(self, 'nick_list_ws', None):
-            return
+            return False
         self.nick_list_existing = {}
         try:
             values = self.nick_list_ws.get_all_values()
@@ -553,8 +1591,10 @@ class Sheets:
                     "last": last_seen,
                 }
             self.nick_list_next_row = len(values) + 1 if values else 2
+            return True
         except Exception as e:
             log_msg(f"Nick list load failed: {e}")
+            return False
 
     def record_nick_seen(self, nickname: str, seen_at: datetime | None = None):
         if not nickname:
@@ -573,7 +1613,7 @@ class Sheets:
             last_seen = ts
             row = entry['row']
             try:
-                self.nick_list_ws.update(range_name=f"A{row}:D{row}", values=[[nickname, str(times), first_seen, last_seen]], value_input_option='USER_ENTERED')
+                self._api(self.nick_list_ws.update, range_name=f"A{row}:D{row}", values=[[nickname, str(times), first_seen, last_seen]], value_input_option='USER_ENTERED')
                 time.sleep(SHEET_WRITE_DELAY)
             except Exception as e:
                 log_msg(f"⚠️ Nick update skipped (quota): {nickname}")
@@ -585,7 +1625,7 @@ class Sheets:
             last_seen = ts
             row = self.nick_list_next_row
             try:
-                self.nick_list_ws.append_row([nickname, "1", first_seen, last_seen])
+                self._api(self.nick_list_ws.append_row, [nickname, "1", first_seen, last_seen])
                 time.sleep(SHEET_WRITE_DELAY)
             except Exception as e:
                 log_msg(f"⚠️ Nick append skipped (quota): {nickname}")
@@ -598,6 +1638,48 @@ class Sheets:
             }
             self.nick_list_next_row += 1
 
+    def record_nicks_bulk(self, sightings: dict) -> bool:
+        """Apply aggregated sightings {key: {"nick", "count", "first", "last"}} with one update and one append.
+
+        Applied entries are removed from `sightings`, so after a partial failure it
+        holds exactly what still has to be retried.
+        """
+        if not sightings or not getattr(self, 'nick_list_ws', None):
+            return False
+        updates = []; appends = []
+        for key, seen in sightings.items():
+            first_ts = seen["first"].strftime("%d-%b-%y %I:%M %p")
+            last_ts = seen["last"].strftime("%d-%b-%y %I:%M %p")
+            entry = self.nick_list_existing.get(key)
+            if entry:
+                times = entry['times'] + seen["count"]
+                updates.append((key, entry, times, {"range": f"A{entry['row']}:D{entry['row']}", "values": [[seen["nick"], str(times), entry['first'] or first_ts, last_ts]]}))
+            else:
+                appends.append((key, seen["count"], first_ts, last_ts, [seen["nick"], str(seen["count"]), first_ts, last_ts]))
+        ok = True
+        if updates:
+            try:
+                self._api(self.nick_list_ws.batch_update, [u[3] for u in updates], value_input_option='USER_ENTERED')
+                for key, entry, times, u in updates:
+                    sightings.pop(key, None)
+                    entry['times'] = times
+                    entry['first'] = u["values"][0][2]
+                    entry['last'] = u["values"][0][3]
+            except Exception as e:
+                ok = False
+                log_msg(f"⚠️ Nick bulk update skipped: {e}")
+        if appends:
+            try:
+                self._api(self.nick_list_ws.append_rows, [a[4] for a in appends], value_input_option='USER_ENTERED')
+                for key, count, first_ts, last_ts, _ in appends:
+                    sightings.pop(key, None)
+                    self.nick_list_existing[key] = {"row": self.nick_list_next_row, "times": count, "first": first_ts, "last": last_ts}
+                    self.nick_list_next_row += 1
+            except Exception as e:
+                ok = False
+                log_msg(f"⚠️ Nick bulk append skipped: {e}")
+        return ok
+
     def update_dashboard(self, metrics: dict):
         try:
             row = [
@@ -613,9 +1695,12 @@ class Sheets:
                 metrics.get("Start", get_pkt_time().strftime("%d-%b-%y %I:%M %p")),
                 metrics.get("End", get_pkt_time().strftime("%d-%b-%y %I:%M %p")),
             ]
-            self.dashboard.append_row(row)
+            row += [metrics.get(col, "") for col in DASHBOARD_HEADERS[len(row):]]
+            self._api(self.dashboard.append_row, row)
+            return True
         except Exception as e:
             log_msg(f"Dashboard update failed: {e}")
+            return False
 
     def _clean_url(self, url):
         if not url or not isinstance(url, str):
@@ -642,7 +1727,7 @@ class Sheets:
                 c = COLUMN_TO_INDEX[col]
                 cell = f"{column_letter(c)}{row_idx}"
                 # Store raw URL instead of formula
-                self.ws.update(values=[[v]], range_name=cell, value_input_option='USER_ENTERED')
+                self._api(self.ws.update, values=[[v]], range_name=cell, value_input_option='USER_ENTERED')
                 time.sleep(SHEET_WRITE_DELAY)
             except Exception as e:
                 log_msg(f"Link update skipped (quota): {col}")
@@ -651,7 +1736,7 @@ class Sheets:
     def _highlight(self, row_idx, indices):
         for idx in indices:
             rng = f"{column_letter(idx)}{row_idx}:{column_letter(idx)}{row_idx}"
-            self.ws.format(rng, {"backgroundColor": {"red":1.0,"green":0.93,"blue":0.85}})
+            self._api(self.ws.format, rng, {"backgroundColor": {"red":1.0,"green":0.93,"blue":0.85}})
             time.sleep(SHEET_WRITE_DELAY)
 
     def _add_notes(self, row_idx, indices, before, new_vals):
@@ -661,68 +1746,447 @@ class Sheets:
             note = f"Before: {before.get(COLUMN_ORDER[idx], '')}\nAfter: {new_vals[idx]}"
             reqs.append({"updateCells":{ "range":{"sheetId": self.ws.id, "startRowIndex":row_idx-1, "endRowIndex":row_idx, "startColumnIndex":idx, "endColumnIndex":idx+1}, "rows":[{"values":[{"note":note}]}], "fields":"note" }})
         if reqs:
-            self.ss.batch_update({"requests": reqs})
+            self._api(self.ss.batch_update, {"requests": reqs})
+
+    def prefetch_rows(self, nicknames, chunk: int = 100):
+        """Fetch the full rows of the given (online) nicknames in batch_get calls and index them."""
+        wanted = []
+        for nick in nicknames:
+            key = nick.strip().lower()
+            rec = self.existing.get(key)
+            if rec and rec.fingerprint is None and key not in self._row_cache:
+                wanted.append((key, rec))
+        last_col = column_letter(len(COLUMN_ORDER)-1)
+        for start in range(0, len(wanted), chunk):
+            part = wanted[start:start+chunk]
+            try:
+                ranges = self._api(self.ws.batch_get, [f"A{rec.row}:{last_col}{rec.row}" for _, rec in part])
+            except Exception as e:
+                log_msg(f"Row prefetch failed: {e}")
+                return
+            for (key, rec), rng in zip(part, ranges):
+                values = rng[0] if rng else []
+                if len(values) > 1 and values[1].strip().lower() == key:
+                    self.existing[key] = ProfileRecord.from_values(rec.row, values)
+                    self._row_cache[key] = values
+        if wanted:
+            log_msg(f"Prefetched {len(self._row_cache)} of {len(wanted)} existing rows")
+
+    def _fetch_row(self, record: ProfileRecord, key: str) -> list:
+        """Load the full sheet row behind an index entry (only needed for changed profiles)."""
+        values = self._api(self.ws.row_values, record.row)
+        if len(values) > 1 and values[1].strip().lower() == key:
+            return values
+        # Index drifted (sheet edited by hand); look the nickname up instead
+        cell = self._api(self.ws.find, key, in_column=2, case_sensitive=False)
+        if not cell:
+            return []
+        record.row = cell.row
+        return self._api(self.ws.row_values, cell.row)
+
+    def _shift_rows(self, below: int | None = None):
+        """Keep indexed row numbers in step with an insert at row 2 (and the delete of old row `below`)."""
+        for rec in self.existing.values():
+            if below is None or rec.row < below:
+                rec.row += 1
 
     def write_profile(self, profile: dict):
         nickname = (profile.get("NICK NAME") or "").strip()
         if not nickname:
             return {"status":"error","error":"Missing nickname","changed_fields":[]}
-        # Normalize
-        if profile.get("LAST POST TIME"):
-            profile["LAST POST TIME"] = convert_relative_date_to_absolute(profile["LAST POST TIME"])
-        profile["DATETIME SCRAP"] = get_pkt_time().strftime("%d-%b-%y %I:%M %p")
-        nickname_lower = nickname.lower()
-        tags_value = self.tags_mapping.get(nickname_lower)
-        if tags_value:
-            profile["TAGS"] = tags_value
-        # Row values
-        row_values = []
-        for c in COLUMN_ORDER:
-            if c == "IMAGE":
-                v = ""
-            elif c == "PROFILE LINK":
-                v = "Profile" if profile.get(c) else ""
-            elif c == "LAST POST":
-                v = "Post" if profile.get(c) else ""
-            else:
-                v = clean_data(profile.get(c, ""))
-            row_values.append(v)
-        key = nickname_lower
+        row_values = profile_row_values(profile, self.tags_mapping)
+        key = nickname.lower()
         existing = self.existing.get(key)
         if existing:
-            before = {COLUMN_ORDER[i]: (existing['data'][i] if i < len(existing['data']) else "") for i in range(len(COLUMN_ORDER))}
             changed = []
-            for i, col in enumerate(COLUMN_ORDER):
-                if col in HIGHLIGHT_EXCLUDE_COLUMNS: continue
-                old = before.get(col, "") or ""; new = row_values[i] or ""
-                if old != new: changed.append(i)
+            before = {}
+            old_values = self._row_cache.pop(key, None)
+            if existing.fingerprint is None or row_fingerprint(row_values) != existing.fingerprint:
+                if old_values is None:
+                    old_values = self._fetch_row(existing, key)
+                before = {COLUMN_ORDER[i]: (old_values[i] if i < len(old_values) else "") for i in range(len(COLUMN_ORDER))}
+                for i in TRACKED_INDICES:
+                    old = before.get(COLUMN_ORDER[i], "") or ""; new = row_values[i] or ""
+                    if old != new: changed.append(i)
+                # Fingerprint differs but no tracked cell did: the index hashes something a rescrape
+                # can't reproduce, so unchanged profiles are paying for a row fetch
+                if existing.fingerprint is not None and not changed:
+                    self.fingerprint_misses += 1
+                    if self.fingerprint_misses == 1:
+                        log_msg(f"⚠️ Fingerprint mismatch for {nickname} with no tracked change; unchanged rows are being re-fetched")
             # Insert at row 2
-            self.ws.insert_row(row_values, 2); self._update_links(2, profile)
+            self._api(self.ws.insert_row, row_values, 2); self._update_links(2, profile)
             if changed:
                 if ENABLE_CELL_HIGHLIGHT:
                     self._highlight(2, changed)
-                self._add_notes(2, changed, before, row_values)
+                if ENABLE_CELL_NOTES:
+                    self._add_notes(2, changed, before, row_values)
             # Delete old row (shift by +1 due to the insert)
+            deleted = True
             try:
-                old_row = existing['row'] + 1 if existing['row'] >= 2 else 3
-                self.ws.delete_rows(old_row)
+                old_row = existing.row + 1 if existing.row >= 2 else 3
+                self._api(self.ws.delete_rows, old_row)
             except Exception as e:
+                deleted = False
                 log_msg(f"Old row delete failed: {e}")
-            self.existing[key] = {'row': 2, 'data': row_values}
+            self._shift_rows(existing.row if deleted else None)
+            self.existing[key] = ProfileRecord.from_values(2, row_values)
             status = "updated" if changed else "unchanged"
-            result = {"status": status, "changed_fields": [COLUMN_ORDER[i] for i in changed]}
+            result = {"status": status, "changed_fields": [COLUMN_ORDER[i] for i in changed],
+                      "delta": {i: row_values[i] for i in changed}}
+        elif key in self.archived:
+            # Returning user: diff against the archived row, which stays in the archive as history
+            title, archived_row = self.archived.pop(key)
+            try:
+                old_values = self._api(self._archive_sheet(title).row_values, archived_row)
+            except Exception as e:
+                log_msg(f"Archived row read failed: {e}")
+                old_values = []
+            if len(old_values) < 2 or old_values[1].strip().lower() != key:
+                old_values = []
+            before = {COLUMN_ORDER[i]: (old_values[i] if i < len(old_values) else "") for i in range(len(COLUMN_ORDER))}
+            changed = [i for i in TRACKED_INDICES if (before[COLUMN_ORDER[i]] or "") != (row_values[i] or "")]
+            self._api(self.ws.insert_row, row_values, 2); self._update_links(2, profile)
+            if changed:
+                if ENABLE_CELL_HIGHLIGHT:
+                    self._highlight(2, changed)
+                if ENABLE_CELL_NOTES:
+                    self._add_notes(2, changed, before, row_values)
+            self._shift_rows()
+            self.existing[key] = ProfileRecord.from_values(2, row_values)
+            result = {"status": "updated" if changed else "unchanged", "changed_fields": [COLUMN_ORDER[i] for i in changed],
+                      "delta": {i: row_values[i] for i in changed}}
         else:
-            self.ws.insert_row(row_values, 2); self._update_links(2, profile)
-            self.existing[key] = {'row': 2, 'data': row_values}
-            result = {"status":"new","changed_fields": list(COLUMN_ORDER)}
+            self._api(self.ws.insert_row, row_values, 2); self._update_links(2, profile)
+            self._shift_rows()
+            self.existing[key] = ProfileRecord.from_values(2, row_values)
+            result = {"status":"new","changed_fields": list(COLUMN_ORDER), "delta": initial_delta(row_values)}
         time.sleep(SHEET_WRITE_DELAY)
         return result
 
+# ------------ Local Output ------------
+
+def add_sighting(pending: dict, nickname: str, seen_at: datetime | None = None):
+    """Aggregate one sighting into {key: {"nick", "count", "first", "last"}} for Sheets.record_nicks_bulk."""
+    key = (nickname or "").strip().lower()
+    if not key:
+        return
+    seen_at = seen_at or get_pkt_time()
+    entry = pending.get(key)
+    if entry:
+        entry["count"] += 1; entry["last"] = seen_at
+    else:
+        pending[key] = {"nick": nickname.strip(), "count": 1, "first": seen_at, "last": seen_at}
+
+def dump_sightings(pending: dict) -> dict:
+    """JSON-safe copy of aggregated sightings."""
+    fmt = "%Y-%m-%d %H:%M:%S"
+    return {k: {**e, "first": e["first"].strftime(fmt), "last": e["last"].strftime(fmt)} for k, e in pending.items()}
+
+def load_sightings(data: dict) -> dict:
+    fmt = "%Y-%m-%d %H:%M:%S"
+    return {k: {**e, "first": datetime.strptime(e["first"], fmt), "last": datetime.strptime(e["last"], fmt)} for k, e in data.items()}
+
+def merge_sightings(into: dict, other: dict) -> dict:
+    """Fold aggregated sightings `other` into `into`."""
+    for key, e in other.items():
+        mine = into.get(key)
+        if mine:
+            mine["count"] += e["count"]
+            mine["first"] = min(mine["first"], e["first"]); mine["last"] = max(mine["last"], e["last"])
+        else:
+            into[key] = dict(e)
+    return into
+
+def load_sync_state(directory: str) -> dict:
+    """How far each OUTPUT_DIR file has been read, plus what was read but not yet written to Sheets.
+
+    Offsets only move once every record read from a file is either written or parked
+    under pending_nicks / pending_profiles / pending_dashboard for the next sync.
+    """
+    try:
+        with open(os.path.join(directory, "sync-state.json"), encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    if "offsets" not in state:
+        state = {"offsets": state}  # older files held just the offsets
+    state.setdefault("pending_nicks", {})
+    state.setdefault("pending_profiles", {})
+    state.setdefault("pending_dashboard", [])
+    return state
+
+def save_sync_state(directory: str, state: dict):
+    path = os.path.join(directory, "sync-state.json")
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+def write_pending_profiles(sheets, profiles: dict) -> dict:
+    """Write profiles to Sheets; return the ones that failed, keyed by nickname."""
+    failed = {}
+    if profiles:
+        sheets.prefetch_rows([p["NICK NAME"].strip() for p in profiles.values()])
+    for key, prof in profiles.items():
+        try:
+            sheets.write_profile(dict(prof))
+        except Exception as e:
+            log_msg(f"⚠️ Sheets sync skipped {prof.get('NICK NAME')}: {str(e)[:50]}")
+            failed[key] = prof
+    return failed
+
+def local_file_sizes(directory: str) -> dict:
+    return {name: os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith(".jsonl")}
+
+class LocalSink(OutputBackend):
+    """Append-only JSONL output in OUTPUT_DIR, written in batches.
+
+    Every scrape is kept (profiles-YYYYMMDD.jsonl); the latest row per nickname
+    lives in an on-disk dbm index so new/updated/unchanged works without a sheet.
+    """
+    def __init__(self, directory: str = OUTPUT_DIR, batch_size: int = LOCAL_BATCH_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.batch_size = max(batch_size, 1)
+        self.buffers = {}
+        self.latest = dbm.open(os.path.join(directory, "latest"), 'c')
+        self.lock = threading.Lock()
+
+    def _append(self, name: str, record: dict):
+        with self.lock:
+            buf = self.buffers.setdefault(name, [])
+            buf.append(json.dumps(record, ensure_ascii=False))
+            if len(buf) >= self.batch_size:
+                self._flush(name)
+
+    def _flush(self, name: str):
+        buf = self.buffers.get(name)
+        if not buf:
+            return
+        with open(os.path.join(self.directory, name), 'a', encoding='utf-8') as f:
+            f.write("\n".join(buf) + "\n")
+        buf.clear()
+
+    def flush(self):
+        with self.lock:
+            for name in list(self.buffers):
+                self._flush(name)
+
+    def write_profile(self, profile: dict) -> dict:
+        nickname = (profile.get("NICK NAME") or "").strip()
+        if not nickname:
+            return {"status":"error","error":"Missing nickname","changed_fields":[]}
+        row_values = profile_row_values(profile)
+        key = nickname.lower().encode('utf-8')
+        with self.lock:
+            previous = self.latest.get(key)
+            self.latest[key] = json.dumps(row_values, ensure_ascii=False)
+        if previous is None:
+            result = {"status": "new", "changed_fields": list(COLUMN_ORDER), "delta": initial_delta(row_values)}
+        else:
+            old = json.loads(previous)
+            changed = [i for i in TRACKED_INDICES if (old[i] if i < len(old) else "") != row_values[i]]
+            result = {"status": "updated" if changed else "unchanged", "changed_fields": [COLUMN_ORDER[i] for i in changed],
+                      "delta": {i: row_values[i] for i in changed}}
+        scraped = get_pkt_time()
+        self._append(f"profiles-{scraped.strftime('%Y%m%d')}.jsonl", {"status": result["status"], "changed_fields": result["changed_fields"], **profile})
+        return result
+
+    def record_nick_seen(self, nickname: str, seen_at: datetime | None = None):
+        if nickname and nickname.strip():
+            seen_at = seen_at or get_pkt_time()
+            self._append("sightings.jsonl", {"nick": nickname.strip(), "seen": seen_at.strftime("%Y-%m-%d %H:%M:%S")})
+
+    def update_dashboard(self, metrics: dict):
+        self._append("dashboard.jsonl", metrics)
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.latest.close()
+
+class SyncedOutput(OutputBackend):
+    """Write to a LocalSink at full speed and sync a summary to Google Sheets in the background.
+
+    The sync thread only pushes the latest profile per nickname, aggregated NickList
+    counts (one bulk update per cycle) and the Dashboard row.
+    """
+    def __init__(self, local: LocalSink, sheets_factory, interval: float = SYNC_INTERVAL):
+        self.local = local
+        self.sheets_factory = sheets_factory
+        self.interval = interval
+        self.pending_profiles = {}
+        self.pending_nicks = {}
+        self.pending_dashboard = []
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="sheets-sync", daemon=True)
+        self.thread.start()
+
+    # Local file and pending entry are updated under one lock, so a sync snapshot
+    # matches the file sizes recorded in sync-state.json.
+    def write_profile(self, profile: dict) -> dict:
+        with self.lock:
+            result = self.local.write_profile(profile)
+            if result.get("status") in {"new", "updated", "unchanged"}:
+                self.pending_profiles[profile["NICK NAME"].strip().lower()] = dict(profile)
+        return result
+
+    def record_nick_seen(self, nickname: str, seen_at: datetime | None = None):
+        with self.lock:
+            self.local.record_nick_seen(nickname, seen_at)
+            add_sighting(self.pending_nicks, nickname, seen_at)
+
+    def update_dashboard(self, metrics: dict):
+        with self.lock:
+            self.local.update_dashboard(metrics)
+            self.pending_dashboard.append(metrics)
+
+    def _sync_once(self, sheets):
+        directory = self.local.directory
+        with self.lock:
+            self.local.flush()
+            sizes = local_file_sizes(directory)
+            profiles, self.pending_profiles = self.pending_profiles, {}
+            nicks, self.pending_nicks = self.pending_nicks, {}
+            dashboard, self.pending_dashboard = self.pending_dashboard, []
+        # Record progress in sync-state.json so a later `sync` command doesn't push it again
+        state = load_sync_state(directory)
+        nicks = merge_sightings(load_sightings(state["pending_nicks"]), nicks)
+        synced_nicks = len(nicks)
+        if nicks:
+            sheets.record_nicks_bulk(nicks)  # leaves only what failed in `nicks`
+            if nicks:
+                log_msg(f"⚠️ NickList sync failed for {len(nicks)} nicks; retrying next cycle")
+            synced_nicks -= len(nicks)
+        state["pending_nicks"] = dump_sightings(nicks)
+        if "sightings.jsonl" in sizes:
+            state["offsets"]["sightings.jsonl"] = sizes["sightings.jsonl"]
+        save_sync_state(directory, state)
+        # Failures stay in sync-state.json (not in memory), so the final cycle at close()
+        # can't drop them: the next cycle or a later `sync` retries them
+        profiles = {**state["pending_profiles"], **profiles}
+        state["pending_profiles"] = write_pending_profiles(sheets, profiles)
+        dashboard = state["pending_dashboard"] + dashboard
+        state["pending_dashboard"] = [m for m in dashboard if not sheets.update_dashboard(m)]
+        state["offsets"].update({name: size for name, size in sizes.items() if name != "sightings.jsonl"})
+        save_sync_state(directory, state)
+        synced_profiles = len(profiles) - len(state["pending_profiles"])
+        if state["pending_profiles"] or state["pending_dashboard"]:
+            log_msg(f"⚠️ Sheets sync kept {len(state['pending_profiles'])} profiles, {len(state['pending_dashboard'])} dashboard rows for retry")
+        if synced_profiles or synced_nicks:
+            log_msg(f"🔄 Synced {synced_profiles} profiles, {synced_nicks} nicks to Sheets")
+
+    def _run(self):
+        try:
+            sheets = self.sheets_factory()
+        except BaseException as e:
+            log_msg(f"❌ Sheets sync disabled: {e}")
+            return
+        while True:
+            stopping = self.stop.wait(self.interval)
+            try:
+                self._sync_once(sheets)
+            except Exception as e:
+                log_msg(f"⚠️ Sheets sync failed: {e}")
+            if stopping:
+                return
+
+    def run_history(self) -> list[dict]:
+        return self.local.run_history()
+
+    def close(self):
+        self.local.flush()
+        self.stop.set()
+        self.thread.join()
+        self.local.close()
+
+def open_output() -> OutputBackend:
+    """Build the OUTPUT_BACKEND selected for this run (replays never touch Sheets)."""
+    if OUTPUT_BACKEND == 'local' or TRAFFIC_MODE == 'replay':
+        return LocalSink()
+    if OUTPUT_BACKEND in {'local+sync', 'sync'}:
+        return SyncedOutput(LocalSink(), lambda: Sheets(gsheets_client()))
+    return Sheets(gsheets_client())
+
+def read_new_lines(path: str, offset: int) -> list[tuple[bytes, int]]:
+    """Complete lines of `path` after byte `offset`, each with the offset just past it."""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    lines = []
+    for line in data.split(b"\n")[:-1]:
+        offset += len(line) + 1
+        if line.strip():
+            lines.append((line, offset))
+    return lines
+
+def sync_local_output(directory: str = OUTPUT_DIR) -> dict:
+    """Push what `local` runs left in `directory` to Google Sheets, resuming where the last sync stopped.
+
+    Progress is saved in sync-state.json after each step (NickList, profiles, each
+    Dashboard row), so a failure part-way never pushes the same sightings twice.
+    NickList entries, profiles and Dashboard rows whose write failed are kept there
+    and retried next time. Only the latest profile per nickname is written.
+    """
+    state = load_sync_state(directory)
+    offsets = state["offsets"]
+    profiles, profile_ends, sightings, dashboard = {}, {}, {}, []
+    sightings_end = None
+    names = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+    for name in names:
+        if not name.endswith(".jsonl"):
+            continue
+        for line, end in read_new_lines(os.path.join(directory, name), offsets.get(name, 0)):
+            rec = json.loads(line)
+            if name.startswith("profiles-"):
+                rec.pop("status", None); rec.pop("changed_fields", None)
+                key = (rec.get("NICK NAME") or "").strip().lower()
+                if key:
+                    profiles[key] = rec
+                profile_ends[name] = end
+            elif name == "sightings.jsonl":
+                add_sighting(sightings, rec["nick"], datetime.strptime(rec["seen"], "%Y-%m-%d %H:%M:%S"))
+                sightings_end = end
+            elif name == "dashboard.jsonl":
+                dashboard.append((rec, end))
+    sightings = merge_sightings(load_sightings(state["pending_nicks"]), sightings)
+    profiles = {**state["pending_profiles"], **profiles}
+    dashboard = [(m, None) for m in state["pending_dashboard"]] + dashboard
+    counts = {"profiles": len(profiles), "nicks": len(sightings), "dashboard": len(dashboard),
+              "profiles_failed": 0, "nicks_failed": 0, "dashboard_failed": 0}
+    if not (profiles or sightings or dashboard):
+        return counts
+    sheets = Sheets(gsheets_client())
+    if sightings:
+        sheets.record_nicks_bulk(sightings)  # leaves only what failed in `sightings`
+        counts["nicks"] -= len(sightings); counts["nicks_failed"] = len(sightings)
+    state["pending_nicks"] = dump_sightings(sightings)
+    if sightings_end is not None:
+        offsets["sightings.jsonl"] = sightings_end
+    save_sync_state(directory, state)
+    if profiles:
+        state["pending_profiles"] = write_pending_profiles(sheets, profiles)
+        offsets.update(profile_ends)
+        save_sync_state(directory, state)
+        counts["profiles"] -= len(state["pending_profiles"]); counts["profiles_failed"] = len(state["pending_profiles"])
+    failed = []
+    for i, (metrics, end) in enumerate(dashboard):
+        if not sheets.update_dashboard(metrics):
+            failed.append(metrics)
+        # Retries not attempted yet stay pending too, in case this stops part-way
+        state["pending_dashboard"] = failed + [m for m, e in dashboard[i+1:] if e is None]
+        if end is not None:
+            offsets["dashboard.jsonl"] = end
+        save_sync_state(directory, state)
+    counts["dashboard"] -= len(failed); counts["dashboard_failed"] = len(failed)
+    return counts
+
 # ------------ Scraping ------------
 
 def fetch_online_nicknames(driver):
     log_msg("Fetching online users...")
-    driver.get(ONLINE_URL); time.sleep(2)
+    driver.get(ONLINE_URL); settle(driver, 2)
     names = []
     try:
         items = driver.find_elements(By.CSS_SELECTOR, "li.mbl.cl.sp b")
@@ -743,12 +2207,16 @@ def fetch_online_nicknames(driver):
     log_msg(f"Found {len(names)} online")
     return names
 
-def scrape_profile(driver, nickname: str) -> dict | None:
+def scrape_profile(driver, nickname: str, report: dict | None = None) -> dict | None:
+    """Scrape one profile; `report` (if given) receives the request's "outcome" and "latency"."""
     url = f"https://damadam.pk/users/{nickname}/"
+    started = time.time()
+    outcome, latency = "error", None
     try:
         log_msg(f"📍 Scraping: {nickname}")
         driver.get(url)
-        WebDriverWait(driver,10).until(EC.presence_of_element_located((By.CSS_SELECTOR,"h1.cxl.clb.lsp")))
+        wait_for_css(driver, "h1.cxl.clb.lsp", 10)
+        latency = time.time()-started
 
         page_source = driver.page_source
         now = get_pkt_time()
@@ -778,6 +2246,7 @@ def scrape_profile(driver, nickname: str) -> dict | None:
             data['STATUS'] = "Suspended"
             data['INTRO'] = f"Suspended: {suspend_reason}"[:250]
             data['SUSPENSION_REASON'] = suspend_reason
+            outcome = "ok"
             return data
 
         if 'account suspended' in page_source.lower():
@@ -858,15 +2327,17 @@ def scrape_profile(driver, nickname: str) -> dict | None:
                 pass
 
         if data.get('POSTS') and data['POSTS']!='0':
-            time.sleep(1)
+            settle(driver, 1)
             post_data=scrape_recent_post(driver, nickname)
             data['LAST POST']=clean_data(post_data.get('LPOST',''))
             data['LAST POST TIME']=post_data.get('LDATE-TIME','')
 
         log_msg(f"✅ Extracted: {data['GENDER']}, {data['CITY']}, Posts: {data['POSTS']}")
+        outcome = "ok"
         return data
     except TimeoutException:
         log_msg(f"⚠️ Timeout while scraping {nickname}")
+        outcome = "timeout"
         return None
     except WebDriverException:
         log_msg(f"⚠️ Browser issue while scraping {nickname}")
@@ -874,99 +2345,808 @@ def scrape_profile(driver, nickname: str) -> dict | None:
     except Exception as e:
         log_msg(f"❌ Error scraping {nickname}: {str(e)[:60]}")
         return None
+    finally:
+        # One report per request, after the whole scrape; latency is the profile page's
+        if latency is None or outcome != "ok":
+            latency = time.time()-started
+        site_controller.observe(latency, outcome)
+        if report is not None:
+            report.update(outcome=outcome, latency=latency)
+
+# ------------ Sharding ------------
+
+def shard_of(nickname: str, shards: int) -> int:
+    """Stable shard for a nickname (same answer in every process and on every node)."""
+    if shards <= 1:
+        return 0
+    digest = hashlib.md5(nickname.strip().lower().encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') % shards
+
+def split_shards(names, shards: int) -> list[list[str]]:
+    buckets = [[] for _ in range(max(shards, 1))]
+    for nick in names:
+        buckets[shard_of(nick, shards)].append(nick)
+    return buckets
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive advisory lock on `path` (a no-op where fcntl is missing)."""
+    with open(path, 'a') as lf:
+        if fcntl: fcntl.flock(lf, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl: fcntl.flock(lf, fcntl.LOCK_UN)
+
+class SpoolQueue:
+    """Append-only JSONL queue guarded by a lock file.
+
+    Workers put() scrape results, the single writer drain()s them. Pointing
+    SPOOL_DIR at a shared mount lets runners on different nodes use it too.
+    """
+    def __init__(self, directory, run_id):
+        os.makedirs(directory, exist_ok=True)
+        self.data_path = os.path.join(directory, f"queue-{run_id}.jsonl")
+        self.lock_path = os.path.join(directory, f"queue-{run_id}.lock")
+        self.control_path = os.path.join(directory, f"queue-{run_id}.control.json")
+        self.offset = 0
+
+    def _locked(self):
+        return file_lock(self.lock_path)
+
+    def put(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._locked():
+            with open(self.data_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def drain(self) -> list[dict]:
+        with self._locked():
+            if not os.path.exists(self.data_path):
+                return []
+            with open(self.data_path, 'rb') as f:
+                f.seek(self.offset)
+                chunk = f.read()
+        # Only consume complete lines; a partial tail is picked up next time
+        end = chunk.rfind(b"\n") + 1
+        self.offset += end
+        return [json.loads(l) for l in chunk[:end].decode('utf-8').splitlines() if l.strip()]
+
+    def publish_control(self, control: dict):
+        """Atomically replace the pacing settings workers read before each request."""
+        tmp = self.control_path + ".tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(control, f)
+        os.replace(tmp, self.control_path)
+
+    def read_control(self) -> dict:
+        try:
+            with open(self.control_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def remove(self):
+        for path in (self.data_path, self.lock_path, self.control_path):
+            try: os.remove(path)
+            except OSError: pass
+
+def shard_worker(shard_idx: int, shards: int, nicknames: list[str] | None, spool_dir: str, run_id: str):
+    """Scrape one shard with its own Chrome and spool the results for the writer.
+
+    With nicknames=None (runner-job mode) the worker fetches the online list itself
+    and keeps the nicknames that hash to its shard.
+    """
+    queue = SpoolQueue(spool_dir, run_id)
+    supervisor = DriverSupervisor()
+    try:
+        if not supervisor.start():
+            for nick in nicknames or []:
+                queue.put({"type": "result", "shard": shard_idx, "nick": nick, "profile": None, "error": "Worker setup failed"})
+            return
+        if nicknames is None:
+            nicknames = [n for n in fetch_online_nicknames(supervisor.driver) if shard_of(n, shards) == shard_idx]
+        log_msg(f"🧩 Shard {shard_idx}: {len(nicknames)} users")
+        for nick in nicknames:
+            # The writer's controller decides how many shards may run at once and the shared spacing
+            control = queue.read_control()
+            while "active" in control and shard_idx not in control["active"]:
+                time.sleep(1)
+                control = queue.read_control()
+            site_started = time.time()
+            prof = supervisor.scrape(nick)
+            queue.put({"type": "result", "shard": shard_idx, "nick": nick, "profile": prof,
+                       "elapsed": round(time.time()-site_started, 3),
+                       "latency": round(supervisor.last_latency, 3), "outcome": supervisor.last_outcome})
+            site_controller.sleep(control.get("spacing", 0.0))
+    finally:
+        queue.put({"type": "done", "shard": shard_idx})
+        supervisor.quit()
+
+def publish_pacing(queue: SpoolQueue, shards: int, done: set) -> list[int]:
+    """Let the first `site_controller.concurrency` unfinished shards run, at the controller's spacing."""
+    pending = [i for i in range(shards) if i not in done]
+    active = pending[:site_controller.concurrency]
+    queue.publish_control({"active": active, "spacing": site_controller.spacing})
+    return active
+
+def consume_spool(output, queue: SpoolQueue, shards: int, stats: dict, total: int, procs: dict | None = None):
+    """Single writer: apply spooled results through the output backend until every shard reports done.
+
+    `procs` maps shard index to its local worker process. A shard whose process
+    died, or (runner-job mode) that stayed active for SHARD_STALL_TIMEOUT without
+    spooling anything, counts as done so the gate moves on to the next shards.
+    """
+    done = set()
+    processed = 0
+    start_time = time.time()
+    deadline = start_time + SPOOL_TIMEOUT
+    active_since = {}
+
+    def apply(records):
+        nonlocal processed
+        for rec in records:
+            shard = rec.get("shard")
+            if shard in active_since:
+                active_since[shard] = time.time()
+            if rec.get("type") == "done":
+                done.add(shard)
+                continue
+            processed += 1
+            nick = rec.get("nick", "")
+            if "outcome" in rec:
+                site_controller.observe(rec.get("latency", 0.0), rec["outcome"])
+            eta = calculate_eta(processed - 1, total, start_time) if total else "?"
+            log_msg(f"[{processed:3d}/{total or '?'} | ETA {eta:>7s}] {nick} (shard {shard})")
+            process_profile(output, nick, rec.get("profile"), stats, rec.get("error"), rec.get("elapsed", 0.0))
+
+    def gate():
+        active = publish_pacing(queue, shards, done)
+        for idx in list(active_since):
+            if idx not in active:
+                del active_since[idx]
+        for idx in active:
+            active_since.setdefault(idx, time.time())
+
+    gate()
+    while len(done) < shards:
+        records = queue.drain()
+        apply(records)
+        lost = set()
+        for idx in range(shards):
+            if idx in done:
+                continue
+            if procs is not None:
+                if idx in procs and not procs[idx].is_alive():
+                    lost.add(idx)
+            elif idx in active_since and time.time() - active_since[idx] > SHARD_STALL_TIMEOUT:
+                lost.add(idx)
+        if lost:
+            apply(queue.drain())  # whatever they spooled before dying
+            for idx in sorted(lost - done):
+                log_msg(f"⚠️ Shard {idx} stopped without finishing; moving on")
+                done.add(idx)
+        if records or lost:
+            gate()
+            continue
+        if time.time() > deadline:
+            log_msg(f"⚠️ Spool timeout, {shards - len(done)} shard(s) never finished")
+            break
+        time.sleep(1)
+    return processed
+
+# ------------ Presence Index ------------
+
+class PresenceIndex:
+    """Bitset presence timeline: one row of bits per nickname, one bit per time slot.
+
+    Rows live in a memory-mapped file (`path`) and nicknames in `path.nicks`, in
+    row order. The window is a ring of PRESENCE_WINDOW_DAYS days. When time moves
+    on, stale slots are cleared. Queries are popcounts over whole rows. With the
+    defaults (1 h slots, 28 days) a nickname costs 84 bytes, so about 50k active
+    nicknames fit in 4 MB. Rows are only created for nicknames that were actually
+    seen. Writers (a run and the poller) share the files under `path.lock` and
+    pick up each other's rows before adding their own.
+    """
+    MAGIC = b"DDPI"
+    HEADER = struct.Struct("<4sHHIqI")  # magic, version, slot minutes, window slots, last slot, rows
+    HEADER_SIZE = 64
+
+    def __init__(self, path: str, slot_minutes: int = PRESENCE_SLOT_MINUTES, window_days: int = PRESENCE_WINDOW_DAYS):
+        if 1440 % slot_minutes:
+            raise ValueError("PRESENCE_SLOT_MINUTES must divide a day")
+        self.path = path
+        self.slot_minutes = slot_minutes
+        self.window_slots = window_days * (1440 // slot_minutes)
+        self.last_slot = -1
+        self.nicks = []
+        self.rows = {}
+        self._nicks_read = 0  # bytes of path.nicks already in self.nicks
+        self._f = None
+        self._mm = None
+
+    @property
+    def row_bytes(self) -> int:
+        return (self.window_slots + 7) // 8
+
+    @property
+    def slots_per_day(self) -> int:
+        return 1440 // self.slot_minutes
+
+    def _capacity(self) -> int:
+        return (len(self._mm) - self.HEADER_SIZE) // self.row_bytes
+
+    def _lock(self):
+        return file_lock(self.path + ".lock")
+
+    def _open(self):
+        """Map the index file, creating it if needed (call under the lock)."""
+        if self._mm is not None:
+            return
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) >= self.HEADER_SIZE
+        self._f = open(self.path, 'r+b' if exists else 'w+b')
+        if exists:
+            magic, _, slot_minutes, window_slots, _, _ = self.HEADER.unpack(self._f.read(self.HEADER.size))
+            if magic != self.MAGIC:
+                raise ValueError(f"{self.path} is not a presence index")
+            # The file's layout wins over the env settings it was created with
+            self.slot_minutes, self.window_slots = slot_minutes, window_slots
+        else:
+            self._f.truncate(self.HEADER_SIZE + 1024 * self.row_bytes)
+        self._mm = mmap.mmap(self._f.fileno(), 0)
+        if not exists:
+            self._write_header()
+
+    def _refresh(self):
+        """Catch up with rows, ring position and file growth from other writers (call under the lock)."""
+        self._open()
+        if os.fstat(self._f.fileno()).st_size != len(self._mm):
+            self._mm.close()
+            self._mm = mmap.mmap(self._f.fileno(), 0)
+        _, _, _, _, self.last_slot, rows = self.HEADER.unpack_from(self._mm, 0)
+        if rows > len(self.nicks):
+            try:
+                with open(self.path + ".nicks", 'rb') as f:
+                    f.seek(self._nicks_read)
+                    data = f.read()
+            except OSError:
+                data = b""
+            for line in data.split(b"\n")[:-1][:rows - len(self.nicks)]:
+                self._nicks_read += len(line) + 1
+                self.rows[line.decode('utf-8')] = len(self.nicks)
+                self.nicks.append(line.decode('utf-8'))
+
+    def _load(self):
+        with self._lock():
+            self._refresh()
+
+    def _write_header(self):
+        self.HEADER.pack_into(self._mm, 0, self.MAGIC, 1, self.slot_minutes, self.window_slots, self.last_slot, len(self.nicks))
+
+    def _grow(self):
+        capacity = self._capacity() * 2
+        self._mm.close()
+        self._f.truncate(self.HEADER_SIZE + capacity * self.row_bytes)
+        self._mm = mmap.mmap(self._f.fileno(), 0)
+
+    def slot_of(self, when: datetime) -> int:
+        """Absolute slot number of a PKT timestamp."""
+        return int((when - datetime(1970, 1, 1)).total_seconds() // (self.slot_minutes * 60))
+
+    def _advance(self, slot: int):
+        """Move the ring forward to `slot`, clearing the bits of every slot it wraps over."""
+        if self.last_slot >= 0 and slot > self.last_slot:
+            stale = range(self.last_slot + 1, min(slot, self.last_slot + self.window_slots) + 1)
+            clear = ~sum(1 << (s % self.window_slots) for s in stale)
+            rb = self.row_bytes
+            for i in range(len(self.nicks)):
+                off = self.HEADER_SIZE + i * rb
+                row = int.from_bytes(self._mm[off:off+rb], 'little') & clear
+                self._mm[off:off+rb] = (row & ((1 << (rb * 8)) - 1)).to_bytes(rb, 'little')
+        self.last_slot = max(self.last_slot, slot)
+
+    def _row(self, i: int) -> int:
+        off = self.HEADER_SIZE + i * self.row_bytes
+        return int.from_bytes(self._mm[off:off+self.row_bytes], 'little')
+
+    def mark(self, nicknames, when: datetime | None = None):
+        """Set the current slot's bit for every nickname in one online list."""
+        if not self.path:
+            return
+        try:
+            self._mark(nicknames, when)
+        except (OSError, ValueError) as e:
+            log_msg(f"Presence index update failed: {e}")
+
+    def _mark(self, nicknames, when: datetime | None):
+        with self._lock():
+            self._refresh()
+            self._mark_locked(nicknames, when)
+
+    def _mark_locked(self, nicknames, when: datetime | None):
+        slot = self.slot_of(when or get_pkt_time())
+        if slot <= self.last_slot - self.window_slots:
+            return  # older than the window
+        self._advance(slot)
+        pos = slot % self.window_slots
+        byte_off, bit = pos // 8, 1 << (pos % 8)
+        new = []
+        for nick in nicknames:
+            key = nick.strip().lower()
+            if not key:
+                continue
+            i = self.rows.get(key)
+            if i is None:
+                if len(self.nicks) >= self._capacity():
+                    self._grow()
+                i = self.rows[key] = len(self.nicks)
+                self.nicks.append(key); new.append(key)
+            off = self.HEADER_SIZE + i * self.row_bytes + byte_off
+            self._mm[off] |= bit
+        if new:
+            data = "".join(n + "\n" for n in new).encode('utf-8')
+            with open(self.path + ".nicks", 'ab') as f:
+                f.truncate(self._nicks_read)  # drop lines a crashed writer never counted in the header
+                f.write(data)
+            self._nicks_read += len(data)
+        self._write_header()
+        self._mm.flush()
+
+    # ---- queries ----
+
+    def _hour_masks(self) -> list[int]:
+        masks = [0] * 24
+        per_hour = 60 / self.slot_minutes
+        for p in range(self.window_slots):
+            masks[int((p % self.slots_per_day) / per_hour) % 24] |= 1 << p
+        return masks
+
+    def slots_seen(self, nickname: str) -> int:
+        self._load()
+        i = self.rows.get(nickname.strip().lower())
+        return self._row(i).bit_count() if i is not None else 0
+
+    def activity(self, nickname: str) -> list[int]:
+        """Hour-of-day histogram (PKT): slots in the window where the nickname was online."""
+        self._load()
+        i = self.rows.get(nickname.strip().lower())
+        if i is None:
+            return [0] * 24
+        row = self._row(i)
+        return [(row & m).bit_count() for m in self._hour_masks()]
+
+    def overlap(self, a: str, b: str) -> int:
+        """Slots in which both nicknames were online."""
+        self._load()
+        ia, ib = self.rows.get(a.strip().lower()), self.rows.get(b.strip().lower())
+        if ia is None or ib is None:
+            return 0
+        return (self._row(ia) & self._row(ib)).bit_count()
+
+    def top_overlaps(self, nickname: str, limit: int = 10) -> list[tuple[str, int]]:
+        """Nicknames most often online at the same time as `nickname`."""
+        self._load()
+        i = self.rows.get(nickname.strip().lower())
+        if i is None:
+            return []
+        row = self._row(i)
+        scores = ((n, (row & self._row(j)).bit_count()) for j, n in enumerate(self.nicks) if j != i)
+        return sorted((x for x in scores if x[1]), key=lambda x: -x[1])[:limit]
+
+    def peak_hours(self) -> list[tuple[int, int]]:
+        """Hours of day ranked by total nickname-slots online across everyone."""
+        self._load()
+        masks = self._hour_masks()
+        totals = [0] * 24
+        for j in range(len(self.nicks)):
+            row = self._row(j)
+            if row:
+                for h, m in enumerate(masks):
+                    totals[h] += (row & m).bit_count()
+        return sorted(enumerate(totals), key=lambda x: -x[1])
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.flush(); self._mm.close(); self._f.close()
+            self._mm = self._f = None
+
+presence_index = PresenceIndex(PRESENCE_INDEX)
+
+# ------------ Presence Poller ------------
+
+def load_presence_backlog(path: str = PRESENCE_FILE) -> tuple[dict, int]:
+    """Sightings not yet in NickList: the leftover saved at the last sync plus every poll appended after it.
+
+    Returns (pending, offset of the end of the last complete poll line).
+    """
+    try:
+        with open(path + ".synced", encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    pending = load_sightings(state.get("pending", {}))
+    offset = state.get("offset", 0)
+    try:
+        with open(path, 'rb') as f:
+            if offset > os.fstat(f.fileno()).st_size:
+                offset = 0  # file was replaced since the last sync
+            f.seek(offset)
+            data = f.read()
+    except OSError:
+        data = b""
+    end = data.rfind(b"\n") + 1
+    if end < len(data):
+        os.truncate(path, offset + end)  # half-written line from a killed poller
+    for line in data[:end].splitlines():
+        try:
+            rec = json.loads(line)
+            seen_at = datetime.strptime(rec["seen"], "%Y-%m-%d %H:%M:%S")
+        except (ValueError, KeyError):
+            continue
+        for nick in rec.get("nicks", []):
+            add_sighting(pending, nick, seen_at)
+    return pending, offset + end
+
+def save_presence_backlog(pending: dict, offset: int, path: str = PRESENCE_FILE):
+    """Remember that polls up to `offset` are in NickList, except for the `pending` leftover."""
+    tmp = path + ".synced.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({"offset": offset, "pending": dump_sightings(pending)}, f, ensure_ascii=False)
+    os.replace(tmp, path + ".synced")
+
+def poll_online(duration: float = POLL_DURATION, interval: float = POLL_INTERVAL, sync_every: float = POLL_SYNC_EVERY):
+    """Cheap presence mode: poll /online_kon/ only, keep sightings locally, sync NickList counts in bulk.
+
+    Runs for `duration` seconds (0 = until interrupted). Profile pages are never opened.
+    Sightings a killed poller did not sync yet are replayed from PRESENCE_FILE on start.
+    """
+    supervisor = DriverSupervisor(setup_browser())
+    if not supervisor.driver:
+        print("❌ Browser setup failed"); sys.exit(1)
+    sheets = None
+    pending, written = load_presence_backlog()
+    if pending:
+        log_msg(f"📡 {len(pending)} unsynced nicks replayed from {PRESENCE_FILE}")
+    polls = 0
+    started = last_sync = time.time()
+
+    def sync():
+        nonlocal sheets
+        if not pending or not SHEET_URL:
+            return
+        if sheets is None:
+            sheets = Sheets(gsheets_client(), nick_list_only=True)
+        # Full runs and format-sheets re-sort NickList and add to Times Seen, so cached rows
+        # and counts go stale; re-read before every write (and skip the cycle if that fails,
+        # or every nick would be appended as new)
+        if not sheets._load_nick_list():
+            log_msg(f"⚠️ NickList sync postponed: {len(pending)} nicks kept for retry")
+            return
+        total = len(pending)
+        sheets.record_nicks_bulk(pending)  # leaves only what failed in `pending`
+        save_presence_backlog(pending, written)
+        log_msg(f"🔄 NickList synced: {total - len(pending)} nicks" + (f", {len(pending)} left for retry" if pending else ""))
+
+    try:
+        if not login(supervisor.driver):
+            print("❌ Login failed"); sys.exit(1)
+        while True:
+            tick = time.time()
+            try:
+                names = fetch_online_nicknames(supervisor.driver)
+                supervisor.pages += 1
+            except WebDriverException as e:
+                log_msg(f"⚠️ Online poll failed: {str(e)[:60]}")
+                names = []
+                supervisor.recycle("poll failed")
+            reason = supervisor._recycle_due()
+            if reason:
+                supervisor.recycle(reason)
+            seen_at = get_pkt_time()
+            if names:
+                polls += 1
+                try:
+                    with open(PRESENCE_FILE, 'ab') as f:
+                        f.write((json.dumps({"seen": seen_at.strftime("%Y-%m-%d %H:%M:%S"), "nicks": names}, ensure_ascii=False) + "\n").encode('utf-8'))
+                        written = f.tell()
+                except OSError as e:
+                    log_msg(f"Presence write failed: {e}")
+                for nick in names:
+                    add_sighting(pending, nick, seen_at)
+                presence_index.mark(names, seen_at)
+            if time.time() - last_sync >= sync_every:
+                sync(); last_sync = time.time()
+            if duration and time.time() - started + interval > duration:
+                break
+            time.sleep(max(0.0, interval - (time.time() - tick)))
+    except KeyboardInterrupt:
+        log_msg("Poller stopped")
+    finally:
+        try: sync()
+        except Exception as e: log_msg(f"⚠️ Final NickList sync failed: {e}")
+        supervisor.quit()
+        presence_index.close()
+        log_msg(f"📡 {polls} polls in {int(time.time()-started)}s")
 
 # ------------ Main (Single Run) with Quota Handling ------------
 
-def main():
+def new_run_stats() -> dict:
+    return {"success": 0, "failed": 0, "suspended": 0, "skipped_quota": 0, "new": 0, "updated": 0, "unchanged": 0}
+
+def process_profile(output, nick: str, prof: dict | None, stats: dict, error: str | None = None, site_secs: float = 0.0):
+    """Record the sighting, write one scrape result and count it (shared by serial and sharded runs)."""
+    write_started = time.time()
+    try:
+        if RUN_RECORDS_SIGHTINGS:
+            output.record_nick_seen(nick)
+        if not prof:
+            raise RuntimeError(error or "Profile scrape failed")
+        suspend_reason = prof.get("SUSPENSION_REASON")
+        if suspend_reason:
+            result = output.write_profile(prof)
+            if result and result.get("delta"):
+                change_log.record(nick, result["delta"])
+            stats["suspended"] += 1
+            log_msg(f"⚠️ {nick} skipped (suspended: {suspend_reason})")
+            return
+        result = output.write_profile(prof)
+        status = result.get("status","error") if result else "error"
+        if result and result.get("delta"):
+            change_log.record(nick, result["delta"])
+        if status in {"new","updated","unchanged"}:
+            stats["success"] += 1
+            stats[status] += 1
+        else:
+            raise RuntimeError(result.get("error","Write failed") if result else "Write failed")
+    except Exception as e:
+        if "429" in str(e) or "quota" in str(e).lower():
+            stats["skipped_quota"] += 1
+            log_msg(f"⚠️ Quota limit hit, skipping: {nick}")
+        else:
+            stats["failed"] += 1
+            log_msg(f"❌ Error: {str(e)[:50]}")
+    finally:
+        run_metrics.add_profile(site_secs, time.time()-write_started)
+
+def run_serial(output, supervisor: DriverSupervisor, names: list[str], stats: dict):
+    start_time = time.time()
+    for i, nick in enumerate(names, 1):
+        eta = calculate_eta(i-1, len(names), start_time)
+        log_msg(f"[{i:3d}/{len(names)} | ETA {eta:>7s}] {nick}")
+        site_started = time.time()
+        prof = supervisor.scrape(nick)
+        process_profile(output, nick, prof, stats, site_secs=time.time()-site_started)
+        if TRAFFIC_MODE == 'replay':
+            continue
+        if BATCH_SIZE > 0 and i % BATCH_SIZE == 0 and i < len(names):
+            log_msg(f"⏸️ Batch cool-off (site pace {site_controller.rate()}/min)"); adaptive.on_batch(); time.sleep(3)
+        # Spacing covers both the site (AIMD) and the Sheets write pacing
+        site_controller.sleep(adaptive.delay())
+
+def run_sharded(output, names: list[str], stats: dict):
+    run_id = SPOOL_RUN_ID or f"local-{os.getpid()}-{int(time.time())}"
+    queue = SpoolQueue(SPOOL_DIR, run_id)
+    shards = split_shards(names, WORKERS)
+    publish_pacing(queue, len(shards), set())
+    ctx = multiprocessing.get_context("spawn")
+    procs = {}
+    for idx, shard in enumerate(shards):
+        if not shard:
+            queue.put({"type": "done", "shard": idx})
+            continue
+        p = ctx.Process(target=shard_worker, args=(idx, len(shards), shard, SPOOL_DIR, run_id), daemon=True)
+        p.start(); procs[idx] = p
+    log_msg(f"🧩 {len(procs)} workers started (shard sizes: {', '.join(str(len(s)) for s in shards)})")
+    try:
+        consume_spool(output, queue, len(shards), stats, len(names), procs)
+    finally:
+        for p in procs.values():
+            p.join(timeout=30)
+            if p.is_alive(): p.terminate()
+        queue.remove()
+
+def print_banner():
     print("\n" + "="*70)
     print("🌐 DamaDam Online Bot v3.2.1 (Quota Aware)")
     print("="*70)
 
+def startup_summary() -> str:
+    parts = [f"module {MODULE_LOAD_SEC:.2f}s"]
+    parts += [f"{label} {secs:.2f}s" for label, secs in IMPORT_TIMES.items()]
+    return ", ".join(parts)
+
+def cmd_poll_online(args):
+    print_banner()
     if not USERNAME or not PASSWORD:
         print("❌ Missing DAMADAM_USERNAME / DAMADAM_PASSWORD"); sys.exit(1)
+    poll_online(duration=args.duration)
+    log_msg(f"⏱️ Imports: {startup_summary()}")
+
+def cmd_sync(args):
+    counts = sync_local_output(args.dir)
+    print(f"🔄 Synced {counts['profiles']} profiles, {counts['nicks']} nicks, {counts['dashboard']} dashboard rows from {args.dir}")
+    failed = counts['profiles_failed'] + counts['nicks_failed'] + counts['dashboard_failed']
+    if failed:
+        print(f"⚠️ {counts['profiles_failed']} profiles, {counts['nicks_failed']} NickList entries and "
+              f"{counts['dashboard_failed']} dashboard rows failed; they are kept for the next sync")
+    print(f"⏱️ Imports: {startup_summary()}")
+
+def cmd_format_sheets(args):
+    Sheets(gsheets_client(), format_only=True)
+    print("🎨 ProfilesOnline, Dashboard and NickList formatted")
+    print(f"⏱️ Imports: {startup_summary()}")
+
+def cmd_archive(args):
+    sheets = Sheets(gsheets_client())
+    moved = sheets.archive_cold(args.days, args.max_rows)
+    print(f"🧊 Archived {moved} rows | {len(sheets.existing)} hot | {len(sheets.archived)} archived nicknames")
+    print(f"⏱️ Imports: {startup_summary()}")
+
+def cmd_bench(args):
+    """Time scrape_profile over every profile page in a traffic archive (no Chrome, no network)."""
+    archive = TrafficArchive(args.archive)
+    nicks = [m.group(1) for url in archive._load() if (m := re.fullmatch(r"https://damadam\.pk/users/([^/]+)", url))]
+    if args.limit:
+        nicks = nicks[:args.limit]
+    if not nicks:
+        print(f"❌ No recorded profile pages in {args.archive} (record some with TRAFFIC_MODE=record)"); sys.exit(1)
+    driver = ReplayDriver(archive)
+    times = []
+    for nick in nicks:
+        started = time.perf_counter()
+        scrape_profile(driver, nick)
+        times.append(time.perf_counter() - started)
+    p95 = statistics.quantiles(times, n=20)[-1] if len(times) >= 2 else times[0]
+    print(f"\n⏱️ Bench: {len(times)} profiles in {sum(times):.2f}s | {len(times)/max(sum(times), 1e-9):.1f} profiles/s | "
+          f"mean {statistics.fmean(times)*1000:.1f} ms | p95 {p95*1000:.1f} ms | {driver.misses} missing pages")
+    print(f"⏱️ Imports: {startup_summary()}")
+
+def cmd_config(args):
+    """Print the effective (non-secret) settings and how long start-up took."""
+    secret = ("PASSWORD", "CREDENTIALS", "USERNAME", "SHEET_URL")
+    for name, value in sorted(globals().items()):
+        if name.isupper() and not name.startswith("_") and isinstance(value, (str, int, float, bool)):
+            if any(s in name for s in secret):
+                value = "(set)" if value else "(unset)"
+            print(f"{name} = {value}")
+    print(f"⏱️ Imports: {startup_summary()}")
+
+def cmd_run(args):
+    print_banner()
+    if SHARD_ROLE != 'writer' and TRAFFIC_MODE != 'replay' and (not USERNAME or not PASSWORD):
+        print("❌ Missing DAMADAM_USERNAME / DAMADAM_PASSWORD"); sys.exit(1)
+    if SHARD_ROLE in {'worker', 'writer'} and not SPOOL_RUN_ID:
+        print("❌ SHARD_ROLE needs SPOOL_RUN_ID (or GITHUB_RUN_ID) shared by all jobs"); sys.exit(1)
     
     run_started_dt = get_pkt_time()
     
     print(f"\n{'='*70}")
     print(f"📊 RUN | Started: {run_started_dt.strftime('%H:%M:%S')}")
     print(f"{'='*70}")
+
+    if SHARD_ROLE == 'worker':
+        shard_worker(SHARD_INDEX, SHARD_COUNT, None, SPOOL_DIR, SPOOL_RUN_ID)
+        return
     
+    output = None
     try:
-        client = gsheets_client()
-        sheets = Sheets(client)
-
-        driver = setup_browser()
-        if not driver:
-            print("❌ Browser setup failed"); sys.exit(1)
-        try:
-            if not login(driver):
-                print("❌ Login failed"); driver.quit(); sys.exit(1)
-            names = fetch_online_nicknames(driver)
-            log_msg(f"📋 Processing {len(names)} users...")
-            # Always process the complete list (ignore MAX_PROFILES_PER_RUN)
-            success = failed = suspended_count = skipped_quota = 0
-            run_stats = {"new":0, "updated":0, "unchanged":0}
-            start_time = time.time()
-            trigger_type = "Scheduled" if os.getenv('GITHUB_EVENT_NAME','').lower()=='schedule' else "Manual"
-            for i, nick in enumerate(names, 1):
-                eta = calculate_eta(i-1, len(names), start_time)
-                log_msg(f"[{i:3d}/{len(names)} | ETA {eta:>7s}] {nick}")
-                sheets.record_nick_seen(nick)
-                try:
-                    prof = scrape_profile(driver, nick)
-                    if not prof:
-                        raise RuntimeError("Profile scrape failed")
-                    suspend_reason = prof.get("SUSPENSION_REASON")
-                    if suspend_reason:
-                        sheets.write_profile(prof)
-                        suspended_count += 1
-                        log_msg(f"⚠️ {nick} skipped (suspended: {suspend_reason})")
-                        continue
-                    result = sheets.write_profile(prof)
-                    status = result.get("status","error") if result else "error"
-                    if status in {"new","updated","unchanged"}:
-                        success += 1
-                        run_stats[status] += 1
-                    else:
-                        raise RuntimeError(result.get("error","Write failed") if result else "Write failed")
-                except Exception as e:
-                    if "429" in str(e) or "quota" in str(e).lower():
-                        skipped_quota += 1
-                        log_msg(f"⚠️ Quota limit hit, skipping: {nick}")
-                    else:
-                        failed += 1
-                        log_msg(f"❌ Error: {str(e)[:50]}")
-                if BATCH_SIZE > 0 and i % BATCH_SIZE == 0 and i < len(names):
-                    log_msg("⏸️ Batch cool-off"); adaptive.on_batch(); time.sleep(3)
-                adaptive.sleep()
-            print(f"\n{'='*70}")
-            print(f"✅ RUN COMPLETED")
-            print(f"{'='*70}")
-            print(f"📊 Results: {success} Success | {failed} Failed | {skipped_quota} Quota-Skipped | {suspended_count} Suspended")
-            print(f"📈 Breakdown: {run_stats['new']} New | {run_stats['updated']} Updated | {run_stats['unchanged']} Unchanged")
-            # Dashboard update
+        output = open_output()
+        output.archive_cold()
+        # Always process the complete list (ignore MAX_PROFILES_PER_RUN)
+        stats = new_run_stats()
+        trigger_type = "Scheduled" if os.getenv('GITHUB_EVENT_NAME','').lower()=='schedule' else "Manual"
+
+        run_metrics.begin()
+        site_controller.begin()
+        if SHARD_ROLE == 'writer':
+            queue = SpoolQueue(SPOOL_DIR, SPOOL_RUN_ID)
+            log_msg(f"📥 Writing results from {SHARD_COUNT} shard job(s)...")
+            total = consume_spool(output, queue, SHARD_COUNT, stats, 0)
+            queue.remove()
+        else:
+            supervisor = DriverSupervisor(setup_browser())
+            if not supervisor.driver:
+                print("❌ Browser setup failed"); sys.exit(1)
             try:
-                sheets.update_dashboard({
-                    "Run Number": 1,
-                    "Last Run": get_pkt_time().strftime("%d-%b-%y %I:%M %p"),
-                    "Profiles Processed": len(names),
-                    "Success": success,
-                    "Failed": failed,
-                    "New Profiles": run_stats.get('new',0),
-                    "Updated Profiles": run_stats.get('updated',0),
-                    "Unchanged Profiles": run_stats.get('unchanged',0),
-                    "Trigger": trigger_type,
-                    "Start": run_started_dt.strftime("%d-%b-%y %I:%M %p"),
-                    "End": get_pkt_time().strftime("%d-%b-%y %I:%M %p"),
-                })
-            except Exception as e:
-                log_msg(f"⚠️ Dashboard update failed: {e}")
-        finally:
-            try: driver.quit()
-            except: pass
+                if not login(supervisor.driver):
+                    print("❌ Login failed"); supervisor.quit(); sys.exit(1)
+                names = fetch_online_nicknames(supervisor.driver)
+                total = len(names)
+                log_msg(f"📋 Processing {len(names)} users...")
+                output.prefetch_rows(names)
+                if TRAFFIC_MODE != 'replay':
+                    presence_index.mark(names)
+                if WORKERS > 1:
+                    # Workers bring their own Chrome; free this one first
+                    supervisor.quit()
+                    run_sharded(output, names, stats)
+                else:
+                    run_serial(output, supervisor, names, stats)
+                    if supervisor.recycles:
+                        log_msg(f"♻️ Chrome recycled {supervisor.recycles} time(s) this run")
+                    if getattr(supervisor.driver, 'misses', 0):
+                        log_msg(f"⚠️ {supervisor.driver.misses} page(s) missing from {TRAFFIC_ARCHIVE}")
+            finally:
+                supervisor.quit()
+
+        print(f"\n{'='*70}")
+        print(f"✅ RUN COMPLETED")
+        print(f"{'='*70}")
+        print(f"📊 Results: {stats['success']} Success | {stats['failed']} Failed | {stats['skipped_quota']} Quota-Skipped | {stats['suspended']} Suspended")
+        print(f"📈 Breakdown: {stats['new']} New | {stats['updated']} Updated | {stats['unchanged']} Unchanged")
+        history = output.run_history()
+        run_number = (history[-1]["run"] + 1) if history else 1
+        perf = run_metrics.summary()
+        perf["site_rate"] = site_controller.rate()
+        regressions = detect_regressions(perf, history)
+        print(f"⏱️ Perf: {perf['profiles_per_min']}/min | {perf['sheets_calls_per_profile']} Sheets calls/profile | "
+              f"{perf['quota_retries']} quota retries | site {perf['site_sec']}s vs sheets {perf['sheets_sec']}s | p95 {perf['p95_sec']}s")
+        print(f"🚦 Site pace: {perf['site_rate']} req/min | concurrency {site_controller.concurrency} | "
+              f"spacing {site_controller.spacing:.2f}s | {site_controller.error_rate():.0%} errors/timeouts | {site_controller.backoffs} backoffs")
+        if regressions:
+            log_msg(f"🐢 Performance regression vs last {REGRESSION_WINDOW} runs: {', '.join(regressions)}")
+        append_run_history({
+            "run": run_number,
+            "timestamp": get_pkt_time().strftime("%d-%b-%y %I:%M %p"),
+            "profiles": total,
+            "success": stats['success'],
+            "failed": stats['failed'],
+            **perf,
+            "regression": regressions,
+        })
+        # Dashboard update
+        try:
+            output.update_dashboard({
+                **{col: perf[key] for col, (key, _) in PERF_COLUMNS.items()},
+                "Regression": ", ".join(regressions),
+                "Run Number": run_number,
+                "Last Run": get_pkt_time().strftime("%d-%b-%y %I:%M %p"),
+                "Profiles Processed": total,
+                "Success": stats['success'],
+                "Failed": stats['failed'],
+                "New Profiles": stats['new'],
+                "Updated Profiles": stats['updated'],
+                "Unchanged Profiles": stats['unchanged'],
+                "Trigger": trigger_type,
+                "Start": run_started_dt.strftime("%d-%b-%y %I:%M %p"),
+                "End": get_pkt_time().strftime("%d-%b-%y %I:%M %p"),
+            })
+        except Exception as e:
+            log_msg(f"⚠️ Dashboard update failed: {e}")
     except Exception as e:
         log_msg(f"❌ Run failed: {e}")
         sys.exit(1)
+    finally:
+        if output:
+            output.close()
+        change_log.close()
+        presence_index.close()
+        log_msg(f"⏱️ Imports: {startup_summary()}")
+
+COMMANDS = {
+    "run": (cmd_run, "Scrape the online list into the configured output (default)"),
+    "poll-online": (cmd_poll_online, "Only poll /online_kon/ and record sightings"),
+    "sync": (cmd_sync, "Push a local OUTPUT_DIR to Google Sheets"),
+    "bench": (cmd_bench, "Time profile parsing over a recorded traffic archive"),
+    "archive": (cmd_archive, "Move cold ProfilesOnline rows into monthly archive sheets"),
+    "format-sheets": (cmd_format_sheets, "Reapply fonts, banding and sort order to the sheets"),
+    "config": (cmd_config, "Print effective settings and start-up time"),
+}
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="Scraper.py", description="DamaDam Online Bot")
+    sub = parser.add_subparsers(dest="command")
+    parsers = {name: sub.add_parser(name, help=help_text) for name, (_, help_text) in COMMANDS.items()}
+    parsers["poll-online"].add_argument("--duration", type=float, default=POLL_DURATION, help="seconds to poll (0 = until stopped)")
+    parsers["sync"].add_argument("--dir", default=OUTPUT_DIR, help="local output directory")
+    parsers["archive"].add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="archive rows not scraped for this many days")
+    parsers["archive"].add_argument("--max-rows", type=int, default=HOT_MAX_ROWS, help="keep at most this many hot rows (0 = no cap)")
+    parsers["bench"].add_argument("--archive", default=TRAFFIC_ARCHIVE, help="traffic archive directory")
+    parsers["bench"].add_argument("--limit", type=int, default=0, help="profiles to time (0 = all)")
+    args = parser.parse_args(argv)
+    COMMANDS[args.command or "run"][0](args)
+
+MODULE_LOAD_SEC = time.perf_counter() - _MODULE_STARTED
 
 if __name__ == "__main__":
     main()